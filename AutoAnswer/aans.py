@@ -1,45 +1,173 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtGui, QtWidgets
-import json
+from plugin_utils.settings import SettingsStore
+from plugin_utils import hooks, identity
+import re
+import time
 
 
+class Rule:
+    """
+    Compiled auto answer rule of one friend
+    """
+
+    def __init__(self, video=True, hours=()):
+        """
+        :param video: if False, calls are answered without sending video
+        :param hours: list of 'HH:MM-HH:MM' windows when calls are answered. Empty list - any time.
+        Window with end before start lasts over midnight
+        :raises ValueError: if a window is malformed or empty
+        """
+        self.video = video
+        self.windows = [self.parse_window(window) for window in hours]
+
+    window_format = re.compile(r'^(\d\d?):(\d\d)-(\d\d?):(\d\d)$')
+
+    @staticmethod
+    def parse_window(window):
+        """
+        :param window: text in format HH:MM-HH:MM
+        :return tuple (start, end) in minutes since midnight
+        """
+        match = Rule.window_format.match(window)
+        if match is None:
+            raise ValueError('Window must be in format HH:MM-HH:MM: {}'.format(window))
+        start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+        if start_hour > 23 or end_hour > 23 or start_minute > 59 or end_minute > 59:
+            raise ValueError('Invalid time in window: {}'.format(window))
+        start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+        if start == end:
+            raise ValueError('Empty window: {}'.format(window))
+        return start, end
+
+    @staticmethod
+    def from_dict(data):
+        return Rule(data.get('video', True), data.get('hours', ()))
+
+    def allows(self, minute):
+        """
+        :param minute: minutes since local midnight
+        """
+        if not self.windows:
+            return True
+        for start, end in self.windows:
+            if start <= minute < end or end < start and (minute >= start or minute < end):
+                return True
+        return False
+
+
+@lazy.measure_startup
 class AutoAnswer(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super(AutoAnswer, self).__init__('AutoAnswer', 'aans', *args)
-        self._data = json.loads(self.load_settings())
-        self._tmp = None
+        self._data = SettingsStore(self)
+        self._index = identity.get_index(self._tox, self._profile)
+        if 'id' in self._data:
+            # old format - list of Tox IDs
+            self._data['friends'] = {tox_id[:64]: {} for tox_id in self._data.pop('id')}
+        self._policy = {}
+        self._active = set()
+        self.compile()
 
     def get_description(self):
         return QtWidgets.QApplication.translate("aans", 'Plugin which allows you to auto answer on calls.')
 
-    def start(self):
-        self._tmp = self._profile.incoming_call
+    def compile(self):
+        """
+        Builds public key -> Rule index from settings
+        """
+        self._policy = {key: Rule.from_dict(rule) for key, rule in self._data['friends'].items()}
 
-        def func(audio, video, friend_number):
-            if self._profile.get_friend_by_number(friend_number).tox_id in self._data['id']:
-                self._profile.accept_call(friend_number, audio, video)
-            else:
-                self._tmp(friend_number, audio, video)
+    def set_rule(self, public_key, rule):
+        """
+        :param rule: dict with rule settings or None to disallow auto answer
+        """
+        if rule is None:
+            self._data['friends'].pop(public_key, None)
+            self._policy.pop(public_key, None)
+        else:
+            self._policy[public_key] = Rule.from_dict(rule)
+            self._data['friends'][public_key] = rule
+        self._data.changed()
 
-        self._profile.incoming_call = func
+    def start(self):
+        hooks.add(self._profile, 'incoming_call', self._short_name, self.incoming_call)
+        hooks.add(self._profile, 'stop_call', self._short_name, self.call_finished)
 
     def stop(self):
-        self._profile.incoming_call = self._tmp
+        hooks.remove(self._profile, 'incoming_call', self._short_name)
+        hooks.remove(self._profile, 'stop_call', self._short_name)
+        self._active.clear()
+
+    def incoming_call(self, audio, video, friend_number):
+        rule = self._policy.get(self._index.public_key(friend_number))
+        if rule is None:
+            return False
+        if rule.windows:
+            now = time.localtime()
+            if not rule.allows(now.tm_hour * 60 + now.tm_min):
+                return False
+        max_calls = self._data.get('max_calls', 0)
+        if max_calls and len(self._active) >= max_calls:
+            return False
+        self._active.add(friend_number)
+        self._profile.accept_call(friend_number, audio, video and rule.video)
+        return True
+
+    def call_finished(self, friend_number, *args):
+        self._active.discard(friend_number)
+
+    def close(self):
+        self._data.close()
 
     def get_menu(self, menu, num):
         friend = self._profile.get_friend(num)
-        if friend.tox_id in self._data['id']:
+        public_key = friend.tox_id[:64]
+        if public_key in self._policy:
             text = 'Disallow auto answer'
         else:
             text = 'Allow auto answer'
         act = QtWidgets.QAction(QtWidgets.QApplication.translate("aans", text), menu)
-        act.triggered.connect(lambda: self.toggle(friend.tox_id))
+        act.triggered.connect(lambda: self.toggle(public_key))
         return [act]
 
     def toggle(self, tox_id):
-        if tox_id in self._data['id']:
-            self._data['id'].remove(tox_id)
+        public_key = tox_id[:64]
+        self.set_rule(public_key, None if public_key in self._policy else {})
+
+    def command(self, command):
+        args = command.split()
+        if len(args) >= 2 and args[0] in ('video', 'hours') and args[1].isdigit():
+            public_key = self._index.public_key(int(args[1]))
+            if public_key is None:
+                return
+            rule = dict(self._data['friends'].get(public_key, {}))
+            if args[0] == 'video':
+                rule['video'] = args[2:] != ['off']
+            else:
+                rule['hours'] = args[2].split(',') if len(args) > 2 else []
+                try:
+                    Rule.from_dict(rule)
+                except ValueError:
+                    return
+            self.set_rule(public_key, rule)
+        elif len(args) == 2 and args[0] == 'max' and args[1].isdigit():
+            self._data['max_calls'] = int(args[1])
+        elif command == 'help':
+            msgbox = QtWidgets.QMessageBox()
+            title = QtWidgets.QApplication.translate("aans", "List of commands for plugin AutoAnswer")
+            msgbox.setWindowTitle(title)
+            text = QtWidgets.QApplication.translate("aans", """Commands:
+video <friend_number> on/off: answer calls of friend with or without video
+hours <friend_number> HH:MM-HH:MM[,HH:MM-HH:MM...]: answer calls of friend only at these hours,
+    start and end must differ, window with end before start lasts over midnight
+hours <friend_number>: answer calls of friend at any time
+max <number>: max number of auto answered calls at the same time, 0 - no limit
+help: show this help""")
+            msgbox.setText(text)
+            msgbox.exec_()
         else:
-            self._data['id'].append(tox_id)
-        self.save_settings(json.dumps(self._data))
+            super(AutoAnswer, self).command(command)
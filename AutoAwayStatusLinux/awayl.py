@@ -1,65 +1,44 @@
 import plugin_super_class
-import threading
-import time
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtCore, QtWidgets
-from subprocess import check_output
-import json
-
-
-class InvokeEvent(QtCore.QEvent):
-    EVENT_TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
-
-    def __init__(self, fn, *args, **kwargs):
-        QtCore.QEvent.__init__(self, InvokeEvent.EVENT_TYPE)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-
-
-class Invoker(QtCore.QObject):
-
-    def event(self, event):
-        event.fn(*event.args, **event.kwargs)
-        return True
-
-_invoker = Invoker()
-
-
-def invoke_in_main_thread(fn, *args, **kwargs):
-    QtCore.QCoreApplication.postEvent(_invoker, InvokeEvent(fn, *args, **kwargs))
+from plugin_utils import scheduler
+from plugin_utils.settings import SettingsStore
 
 
+@lazy.measure_startup
 class AutoAwayStatusLinux(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super().__init__('AutoAwayStatusLinux', 'awayl', *args)
-        self._thread = None
-        self._exec = None
-        self._active = False
-        self._time = json.loads(self.load_settings())['time']
+        self._job = None
+        self._process = QtCore.QProcess()
+        self._process.finished.connect(lambda *args: self.idle_checked())
+        self._data = SettingsStore(self)
+        self._time = self._data['time']
         self._prev_status = 0
 
     def close(self):
         self.stop()
+        self._data.close()
 
     def stop(self):
-        self._exec = False
-        if self._active:
-            self._thread.join()
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+        self._process.kill()
 
     def start(self):
-        self._exec = True
-        self._thread = threading.Thread(target=self.loop)
-        self._thread.start()
+        self._job = scheduler.call_every(5, self.check_idle)
 
     def save(self):
-        self.save_settings('{"time": ' + str(self._time) + '}')
+        self._data['time'] = self._time
 
     def change_status(self, status=1):
         if self._profile.status in (0, 2):
             self._prev_status = self._profile.status
         if status is not None:
-            invoke_in_main_thread(self._profile.set_status, status)
+            self._profile.set_status(status)
 
     def get_window(self):
         inst = self
@@ -92,14 +71,18 @@ class AutoAwayStatusLinux(plugin_super_class.PluginSuperClass):
 
         return Window()
 
-    def loop(self):
-        self._active = True
-        while self._exec:
-            time.sleep(5)
-            d = check_output(['xprintidle'])
-            d = int(d) // 1000
-            if self._time:
-                if d > 60 * self._time:
-                    self.change_status()
-                elif self._profile.status == 1:
-                    self.change_status(self._prev_status)
\ No newline at end of file
+    def check_idle(self):
+        # xprintidle runs asynchronously, result is handled in idle_checked
+        if self._process.state() == QtCore.QProcess.NotRunning:
+            self._process.start('xprintidle')
+
+    def idle_checked(self):
+        try:
+            d = int(bytes(self._process.readAllStandardOutput())) // 1000
+        except ValueError:
+            return
+        if self._time:
+            if d > 60 * self._time:
+                self.change_status()
+            elif self._profile.status == 1:
+                self.change_status(self._prev_status)
@@ -1,9 +1,10 @@
 import plugin_super_class
-import threading
-import time
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtCore, QtWidgets
 from ctypes import Structure, windll, c_uint, sizeof, byref
-import json
+from plugin_utils import scheduler
+from plugin_utils.settings import SettingsStore
 
 
 class LASTINPUTINFO(Structure):
@@ -18,59 +19,35 @@ def get_idle_duration():
     return millis / 1000.0
 
 
-class InvokeEvent(QtCore.QEvent):
-    EVENT_TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
-
-    def __init__(self, fn, *args, **kwargs):
-        QtCore.QEvent.__init__(self, InvokeEvent.EVENT_TYPE)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-
-
-class Invoker(QtCore.QObject):
-
-    def event(self, event):
-        event.fn(*event.args, **event.kwargs)
-        return True
-
-_invoker = Invoker()
-
-
-def invoke_in_main_thread(fn, *args, **kwargs):
-    QtCore.QCoreApplication.postEvent(_invoker, InvokeEvent(fn, *args, **kwargs))
-
-
+@lazy.measure_startup
 class AutoAwayStatusWindows(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super().__init__('AutoAwayStatusWindows', 'awayw', *args)
-        self._thread = None
-        self._exec = None
-        self._active = False
-        self._time = json.loads(self.load_settings())['time']
+        self._job = None
+        self._data = SettingsStore(self)
+        self._time = self._data['time']
         self._prev_status = 0
 
     def close(self):
         self.stop()
+        self._data.close()
 
     def stop(self):
-        self._exec = False
-        if self._active:
-            self._thread.join()
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
 
     def start(self):
-        self._exec = True
-        self._thread = threading.Thread(target=self.loop)
-        self._thread.start()
+        self._job = scheduler.call_every(5, self.check_idle)
 
     def save(self):
-        self.save_settings('{"time": ' + str(self._time) + '}')
+        self._data['time'] = self._time
 
     def change_status(self, status=1):
         if self._profile.status != 1:
             self._prev_status = self._profile.status
-        invoke_in_main_thread(self._profile.set_status, status)
+        self._profile.set_status(status)
 
     def get_window(self):
         inst = self
@@ -103,13 +80,10 @@ class AutoAwayStatusWindows(plugin_super_class.PluginSuperClass):
 
         return Window()
 
-    def loop(self):
-        self._active = True
-        while self._exec:
-            time.sleep(5)
-            d = get_idle_duration()
-            if self._time:
-                if d > 60 * self._time:
-                    self.change_status()
-                elif self._profile.status == 1:
-                    self.change_status(self._prev_status)
+    def check_idle(self):
+        d = get_idle_duration()
+        if self._time:
+            if d > 60 * self._time:
+                self.change_status()
+            elif self._profile.status == 1:
+                self.change_status(self._prev_status)
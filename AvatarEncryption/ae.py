@@ -1,15 +1,18 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 import json
 import settings
 import os
 
 
+@lazy.measure_startup
 class AvatarEncryption(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super(AvatarEncryption, self).__init__('AvatarEncryption', 'ae', *args)
         self._path = settings.ProfileHelper.get_path() + 'avatars/'
-        self._contacts = self._profile._contacts[:]
+        self._contacts = None  # contacts known at start, avatars of friends added later are not encrypted
 
     def close(self):
         if not self._encrypt_save.has_password():
@@ -17,7 +20,7 @@ class AvatarEncryption(plugin_super_class.PluginSuperClass):
         i, data = 1, {}
 
         self.save_contact_avatar(data, self._profile, 0)
-        for friend in self._contacts:
+        for friend in self._contacts if self._contacts is not None else self._profile._contacts:
             self.save_contact_avatar(data, friend, i)
             i += 1
         self.save_settings(json.dumps(data))
@@ -26,6 +29,7 @@ class AvatarEncryption(plugin_super_class.PluginSuperClass):
         if not self._encrypt_save.has_password():
             return
         data = json.loads(self.load_settings())
+        self._contacts = self._profile._contacts[:]
 
         self.load_contact_avatar(data, self._profile)
         for friend in self._contacts:
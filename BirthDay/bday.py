@@ -1,33 +1,147 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtWidgets, QtCore
-import json
+from plugin_utils.settings import SettingsStore
+from plugin_utils import identity, outbox, scheduler
 import importlib
 
 
+@lazy.measure_startup
 class BirthDay(plugin_super_class.PluginSuperClass):
 
+    # scheduler uses monotonic clock, which stops while computer sleeps, so midnight is checked at least this often
+    max_sleep = 600
+    # settings are loaded and today's birthdays are shown after client's startup
+    start_delay = 5
+
+    _data = lazy.attribute(SettingsStore)
+    _dates = lazy.attribute(lambda plugin: plugin.parse_dates())  # key -> (day, month, year)
+    _birthdays = lazy.attribute(lambda plugin: plugin.group_dates())  # (month, day) -> list of keys
+
     def __init__(self, *args):
         super(BirthDay, self).__init__('BirthDay', 'bday', *args)
-        self._data = json.loads(self.load_settings())
         self._datetime = importlib.import_module('datetime')
-        self._timers = []
+        self._timers = {}
+        self._index = identity.get_index(self._tox, self._profile)
+        self._midnight = None
+        self._notified = None
+        self._msgbox = None
+
+    @staticmethod
+    def parse_date(text):
+        """
+        :param text: date in format dd.mm.yyyy
+        :return tuple (day, month, year) or None if date is invalid
+        """
+        try:
+            day, month, year = map(int, text.split('.'))
+        except (AttributeError, ValueError):
+            return None
+        if not 1 <= month <= 12 or not 1 <= day <= 31:
+            return None
+        return day, month, year
+
+    def parse_dates(self):
+        """
+        :return dict key -> (day, month, year) of friends with valid dates
+        """
+        dates = {}
+        own_key = self._profile.tox_id[:64]
+        for key in self._data:
+            if key not in (own_key, 'send_date', 'remind_days'):
+                date = self.parse_date(self._data[key])
+                if date is not None:
+                    dates[key] = date
+        return dates
+
+    def group_dates(self):
+        """
+        :return dict (month, day) -> list of keys
+        """
+        birthdays = {}
+        for key, (day, month, _) in self._dates.items():
+            birthdays.setdefault((month, day), []).append(key)
+        return birthdays
+
+    def index_date(self, key, text):
+        """
+        Updates (month, day) -> keys index with friend's date
+        """
+        birthdays = self._birthdays
+        old = self._dates.pop(key, None)
+        if old is not None:
+            keys = birthdays[(old[1], old[0])]
+            keys.remove(key)
+            if not keys:
+                del birthdays[(old[1], old[0])]
+        date = self.parse_date(text)
+        if date is not None:
+            self._dates[key] = date
+            birthdays.setdefault((date[1], date[0]), []).append(key)
+
+    def birthdays(self, date):
+        """
+        :return list of (key, age) of friends with birthday on date.
+        Friends born on February 29 are returned on February 28 in non-leap years
+        """
+        keys = list(self._birthdays.get((date.month, date.day), ()))
+        if date.month == 2 and date.day == 28 and (date + self._datetime.timedelta(1)).month == 3:
+            keys.extend(self._birthdays.get((2, 29), ()))
+        return [(key, date.year - self._dates[key][2]) for key in keys]
 
     def start(self):
+        if self._midnight is not None:
+            self._midnight.cancel()
+        self._notified = None
+        self._midnight = scheduler.call_later(self.start_delay, self.midnight)
+
+    def midnight(self):
+        """
+        Shows today's birthdays and reminders once a day and schedules itself at the next local midnight.
+        Date is checked again every time the job runs, so early or late runs (DST, sleep) are harmless
+        """
         now = self._datetime.datetime.now()
-        today = {}
-        x = self._profile.tox_id[:64]
-        for key in self._data:
-            if key != x and key != 'send_date':
-                arr = self._data[key].split('.')
-                if int(arr[0]) == now.day and int(arr[1]) == now.month:
-                    today[key] = now.year - int(arr[2])
-        if len(today):
-            msgbox = QtWidgets.QMessageBox()
-            title = QtWidgets.QApplication.translate('BirthDay', "Birthday!")
-            msgbox.setWindowTitle(title)
-            text = ', '.join(self._profile.get_friend_by_number(self._tox.friend_by_public_key(x)).name + ' ({})'.format(today[x]) for x in today)
-            msgbox.setText('Birthdays: ' + text)
-            msgbox.exec_()
+        today = now.date()
+        if today != self._notified:
+            self._notified = today
+            lines = [self.names(self.birthdays(today), QtWidgets.QApplication.translate('BirthDay', 'Birthdays: '))]
+            days = self._data.get('remind_days', 0)
+            if days:
+                text = QtWidgets.QApplication.translate('BirthDay', 'Birthdays in {} days: ').format(days)
+                lines.append(self.names(self.birthdays(today + self._datetime.timedelta(days)), text))
+            self.notify('\n'.join(line for line in lines if line))
+        next_midnight = self._datetime.datetime.combine(today + self._datetime.timedelta(1), self._datetime.time())
+        # timestamps of local times take DST changes into account
+        delay = next_midnight.timestamp() - now.timestamp()
+        self._midnight = scheduler.call_later(min(max(delay, 0), self.max_sleep), self.midnight)
+
+    def names(self, birthdays, text):
+        """
+        :return text with names and ages of friends or empty string
+        """
+        names = []
+        for key, age in birthdays:
+            friend_number = self._index.number(key)
+            if friend_number is not None:
+                names.append(self._profile.get_friend_by_number(friend_number).name + ' ({})'.format(age))
+        return text + ', '.join(names) if names else ''
+
+    def notify(self, text):
+        """
+        Shows non modal message box, so scheduler jobs keep running while it's open
+        """
+        if not text:
+            return
+        self._msgbox = QtWidgets.QMessageBox()
+        title = QtWidgets.QApplication.translate('BirthDay', "Birthday!")
+        self._msgbox.setWindowTitle(title)
+        self._msgbox.setText(text)
+        self._msgbox.show()
+
+    def close(self):
+        if lazy.is_loaded(self, '_data'):
+            self._data.close()
 
     def get_window(self):
         inst = self
@@ -55,32 +169,54 @@ class BirthDay(plugin_super_class.PluginSuperClass):
 
             def save_curr_date(self):
                 inst._data[x] = self.date.text()
-                inst.save_settings(json.dumps(inst._data))
                 self.close()
 
             def update(self):
                 inst._data['send_date'] = self.send.isChecked()
-                inst.save_settings(json.dumps(inst._data))
 
         return Window()
 
     def lossless_packet(self, data, friend_number):
         if len(data):
-            friend = self._profile.get_friend_by_number(friend_number)
-            self._data[friend.tox_id] = data
-            self.save_settings(json.dumps(self._data))
+            tox_id = self._index.tox_id(friend_number)
+            if tox_id is not None and self._data.get(tox_id) != data:
+                self._data[tox_id] = data
+                self.index_date(tox_id, data)
         elif self._data['send_date'] and self._profile.tox_id[:64] in self._data:
             self.send_lossless(self._data[self._profile.tox_id[:64]], friend_number)
 
     def friend_connected(self, friend_number):
-        timer = QtCore.QTimer()
-        timer.timeout.connect(lambda: self.timer(friend_number))
-        timer.start(10000)
-        self._timers.append(timer)
+        self._index.friend_connected(friend_number)
+        if friend_number not in self._timers:
+            self._timers[friend_number] = scheduler.call_later(10, self.timer, friend_number)
 
     def timer(self, friend_number):
-        timer = self._timers.pop()
-        timer.stop()
-        if self._profile.get_friend_by_number(friend_number).tox_id not in self._data:
-            self.send_lossless('', friend_number)
+        del self._timers[friend_number]
+        tox_id = self._index.tox_id(friend_number)
+        if tox_id is not None and tox_id not in self._data:
+            outbox.send(self, '', friend_number, outbox.LOW, 'request')
+
+    def stop(self):
+        for job in self._timers.values():
+            job.cancel()
+        self._timers.clear()
+        if self._midnight is not None:
+            self._midnight.cancel()
+            self._midnight = None
+
+    def command(self, command):
+        args = command.split()
+        if len(args) == 2 and args[0] == 'remind' and args[1].isdigit():
+            self._data['remind_days'] = int(args[1])
+        elif command == 'help':
+            msgbox = QtWidgets.QMessageBox()
+            title = QtWidgets.QApplication.translate('BirthDay', "List of commands for plugin BirthDay")
+            msgbox.setWindowTitle(title)
+            text = QtWidgets.QApplication.translate('BirthDay', """Commands:
+remind <days>: remind about birthdays specified number of days ahead, 0 - don't remind
+help: show this help""")
+            msgbox.setText(text)
+            msgbox.exec_()
+        else:
+            super(BirthDay, self).command(command)
 
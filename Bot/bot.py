@@ -1,36 +1,16 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtCore
-import time
-
-
-class InvokeEvent(QtCore.QEvent):
-    EVENT_TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
-
-    def __init__(self, fn, *args, **kwargs):
-        QtCore.QEvent.__init__(self, InvokeEvent.EVENT_TYPE)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-
-
-class Invoker(QtCore.QObject):
-
-    def event(self, event):
-        event.fn(*event.args, **event.kwargs)
-        return True
-
-_invoker = Invoker()
-
-
-def invoke_in_main_thread(fn, *args, **kwargs):
-    QtCore.QCoreApplication.postEvent(_invoker, InvokeEvent(fn, *args, **kwargs))
+from plugin_utils import hooks
+from plugin_utils.invoke import invoke_in_main_thread
 
 
+@lazy.measure_startup
 class Bot(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super(Bot, self).__init__('Bot', 'bot', *args)
-        self._callback = None
         self._mode = 0
         self._message = "I'm away, will back soon"
         self._timer = QtCore.QTimer()
@@ -49,17 +29,16 @@ class Bot(plugin_super_class.PluginSuperClass):
 
     def initialize(self):
         self._timer.stop()
-        self._callback = self._tox.friend_message_cb
+        hooks.add_callback(self._tox, 'friend_message', self._short_name, self.incoming_message)
 
-        def incoming_message(tox, friend_number, message_type, message, size, user_data):
-            self._callback(tox, friend_number, message_type, message, size, user_data)
-            if self._profile.status == 1:
-                self.answer(friend_number, str(message, 'utf-8'))
-
-        self._tox.callback_friend_message(incoming_message, None)
+    def incoming_message(self, tox, friend_number, message_type, message, size, user_data):
+        # message is not consumed, client shows it as usual
+        if self._profile.status == 1:
+            self.answer(friend_number, str(message, 'utf-8'))
 
     def stop(self):
-        self._tox.callback_friend_message(self._callback, None)
+        self._timer.stop()
+        hooks.remove_callback(self._tox, 'friend_message', self._short_name)
 
     def close(self):
         self.stop()
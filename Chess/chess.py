@@ -1,14 +1,23 @@
 # -*- coding: utf-8 -*-
 
+from plugin_utils import lazy
+lazy.importing(__name__)
+
+import asyncio
 import collections
+import json
 import re
 import math
+import shlex
+import struct
+import threading
+import time
 import plugin_super_class
+from plugin_utils import invoke, outbox, profiler, scheduler
 
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QtSvg import *
 
 
 START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
@@ -403,6 +412,47 @@ class Position(object):
         """
         return Position(self.fen)
 
+    __packed_symbols = ".PNBRQK..pnbrqk"
+
+    def pack(self):
+        """Packs the position into a compact byte string.
+
+        :return:
+            38 bytes: the board with one nibble per square followed by
+            the turn and castling flags, the en-passant file and the
+            move counters. `Position.from_packed()` restores it without
+            parsing a FEN.
+        """
+        data = bytearray(32)
+        for i in range(64):
+            piece = self.__board[(i >> 3) * 16 + (i & 7)]
+            if piece:
+                data[i >> 1] |= Position.__packed_symbols.index(piece.symbol) << (4 * (i & 1))
+        flags = 1 if self.__turn == "b" else 0
+        for i, type in enumerate("KQkq"):
+            if type in self.__castling:
+                flags |= 2 << i
+        ep = "abcdefgh".index(self.__ep_file) + 1 if self.__ep_file else 0
+        return bytes(data) + struct.pack(">BBHH", flags, ep, self.__half_moves, self.__ply)
+
+    @classmethod
+    def from_packed(cls, data):
+        """Creates a position from the output of `Position.pack()`."""
+        position = cls.__new__(cls)
+        board = [None] * 128
+        for i in range(64):
+            code = (data[i >> 1] >> (4 * (i & 1))) & 15
+            if code:
+                board[(i >> 3) * 16 + (i & 7)] = Piece(Position.__packed_symbols[code])
+        flags, ep, half_moves, ply = struct.unpack(">BBHH", data[32:])
+        position.__board = board
+        position.__turn = "b" if flags & 1 else "w"
+        position.__castling = "".join(type for i, type in enumerate("KQkq") if flags & (2 << i))
+        position.__ep_file = "abcdefgh"[ep - 1] if ep else None
+        position.__half_moves = half_moves
+        position.__ply = ply
+        return position
+
     def __get_square_index(self, square_or_int):
         if type(square_or_int) is int:
             # Validate the index by passing it through the constructor.
@@ -1161,6 +1211,24 @@ class Position(object):
             if not potential_position.is_king_attacked(self.turn):
                 yield move
 
+    def is_legal(self, move):
+        """Checks whether a move is legal in the current position.
+
+        Unlike a lookup in `Position.get_legal_moves()`, only the given
+        move is checked for leaving the king in check.
+
+        :return:
+            A boolean indicating whether the move is legal.
+        """
+        piece = self[move.source]
+        if not piece or piece.color != self.turn:
+            return False
+        if move not in self.get_pseudo_legal_moves():
+            return False
+        potential_position = self.copy()
+        potential_position.make_move(move, False)
+        return not potential_position.is_king_attacked(self.turn)
+
     def get_attackers(self, color, square):
         """Gets the attackers of a specific square.
 
@@ -1356,6 +1424,108 @@ class Position(object):
         return self.fen != other.fen
 
 
+def perft(position, depth):
+    """:return: The number of leaf nodes of the legal move tree of the
+    given depth, for checking move generation."""
+    if depth == 0:
+        return 1
+    count = 0
+    for move in position.get_legal_moves():
+        if depth == 1:
+            count += 1
+        else:
+            count += perft(position.copy().make_move(move, False), depth - 1)
+    return count
+
+
+class GameHistory(object):
+    """The moves of a game with snapshots for fast navigation.
+
+    A packed copy of the position is stored every `interval` plies, so
+    any position of the game is restored by replaying at most
+    `interval - 1` already validated moves.
+
+    :param fen:
+        Optional. The FEN of the start position.
+    :param interval:
+        Optional. Number of plies between two snapshots.
+    """
+
+    def __init__(self, fen=START_FEN, interval=8):
+        self.__interval = interval
+        self.__moves = []
+        self.__sans = []
+        self.__snapshots = [Position(fen).pack()]
+
+    def __len__(self):
+        return len(self.__moves)
+
+    @property
+    def moves(self):
+        """The list of moves played so far."""
+        return list(self.__moves)
+
+    @property
+    def sans(self):
+        """The moves played so far in standard algebraic notation."""
+        return list(self.__sans)
+
+    def push(self, move, san, position):
+        """Appends a move.
+
+        :param san:
+            The standard algebraic notation of the move.
+        :param position:
+            The position after the move.
+        """
+        self.__moves.append(move)
+        self.__sans.append(san)
+        if len(self.__moves) % self.__interval == 0:
+            self.__snapshots.append(position.pack())
+
+    def position_at(self, ply):
+        """:return: A new position after the first `ply` moves.
+
+        :param ply:
+            An integer between 0 and the number of moves.
+        """
+        if ply < 0 or ply > len(self.__moves):
+            raise IndexError("Ply out of range: %s." % repr(ply))
+        index = ply // self.__interval
+        position = Position.from_packed(self.__snapshots[index])
+        for move in self.__moves[index * self.__interval:ply]:
+            position.make_move(move, False)
+        return position
+
+    def truncate(self, ply):
+        """Drops all moves after the first `ply` moves."""
+        del self.__moves[ply:]
+        del self.__sans[ply:]
+        del self.__snapshots[ply // self.__interval + 1:]
+
+
+_piece_renderers = {}
+_background = []
+
+
+def piece_renderers():
+    """:return: SVG renderers of the piece set by piece, shared by all
+    boards and dialogs. Loaded on first call."""
+    if not _piece_renderers:
+        from PyQt5.QtSvg import QSvgRenderer  # QtSvg is imported when the first board is drawn
+        for symbol in "PNBRQKpnbrqk":
+            piece = Piece(symbol)
+            _piece_renderers[piece] = QSvgRenderer(plugin_super_class.path_to_data('chess') + "classic-pieces/%s-%s.svg" % (piece.full_color, piece.full_type))
+    return _piece_renderers
+
+
+def background_pixmap():
+    """:return: The board background, shared by all boards."""
+    if not _background:
+        _background.append(QPixmap(plugin_super_class.path_to_data('chess') + "background.png"))
+    return _background[0]
+
+
 class Board(QWidget):
 
     def __init__(self, parent):
@@ -1366,34 +1536,114 @@ class Board(QWidget):
         self.lightSquareColor = QColor(255, 255, 255)
         self.darkSquareColor = QColor(100, 100, 255)
         self.borderColor = QColor(100, 100, 200)
+        self.premoveColor = QColor(255, 160, 60, 160)
         self.shadowWidth = 2
         self.rotation = 0
         self.ply = 1
-        self.setWindowTitle('Chess')
-        self.backgroundPixmap = QPixmap(plugin_super_class.path_to_data('chess') + "background.png")
+        self.title = 'Chess'
+        self.analysis = ''
+        self.setWindowTitle(self.title)
+        self.backgroundPixmap = background_pixmap()
 
         self.draggedSquare = None
         self.dragPosition = None
+        self.premoves = []
 
         self.position = Position()
+        self.history = GameHistory()
+        self.viewedPly = None
+        self.viewedPosition = None
 
         self.parent = parent
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.moveList = MoveList(self)
 
-        # Load piece set.
-        self.pieceRenderers = dict()
-        for symbol in "PNBRQKpnbrqk":
-            piece = Piece(symbol)
-            self.pieceRenderers[piece] = QSvgRenderer(plugin_super_class.path_to_data('chess') + "classic-pieces/%s-%s.svg" % (piece.full_color, piece.full_type))
+        self.pieceRenderers = piece_renderers()
 
     def update_title(self, my_move=False):
         if self.position.is_checkmate():
-            self.setWindowTitle('Checkmate')
+            self.title = 'Checkmate'
         elif self.position.is_stalemate():
-            self.setWindowTitle('Stalemate')
+            self.title = 'Stalemate'
         else:
-            self.setWindowTitle('Chess' + (' [Your move]' if my_move else ''))
+            self.title = 'Chess' + (' [Your move]' if my_move else '')
+        self.show_title()
+
+    def set_analysis(self, info):
+        text = 'depth {}'.format(info.get('depth', '?'))
+        if 'score' in info:
+            kind, value = info['score']
+            # UCI scores are relative to the side to move.
+            if self.position.turn == 'b':
+                value = -value
+            text += ' #{}'.format(value) if kind == 'mate' else ' {:+.2f}'.format(value / 100)
+        if info.get('pv'):
+            text += ' ' + ' '.join(move.uci for move in info['pv'][:6])
+        self.analysis = text
+        self.show_title()
+
+    def show_title(self):
+        if self.analysis:
+            self.setWindowTitle(self.title + ' | ' + self.analysis)
+        else:
+            self.setWindowTitle(self.title)
+
+    def make_move(self, move):
+        san = self.position.get_move_info(move).san
+        self.position.make_move(move, False)
+        self.history.push(move, san, self.position)
+        self.ply += 1
+        self.moveList.append(san)
+        self.showPly(len(self.history))
+
+    def takeback(self, ply):
+        self.position = self.history.position_at(ply)
+        self.history.truncate(ply)
+        self.ply = ply + 1
+        self.premoves = []
+        self.moveList.truncate(ply)
+        self.showPly(ply)
+
+    def shownPosition(self):
+        return self.position if self.viewedPly is None else self.viewedPosition
+
+    def showPly(self, ply):
+        if ply < 0 or ply > len(self.history):
+            return
+        if ply == len(self.history):
+            self.viewedPly = None
+            self.viewedPosition = None
+        elif ply != self.viewedPly:
+            self.viewedPly = ply
+            self.viewedPosition = self.history.position_at(ply)
+        self.draggedSquare = None
+        self.moveList.select(ply)
+        self.repaint()
+
+    def keyPressEvent(self, e):
+        current = len(self.history) if self.viewedPly is None else self.viewedPly
+        if e.key() == Qt.Key_Left:
+            self.showPly(current - 1)
+        elif e.key() == Qt.Key_Right:
+            self.showPly(current + 1)
+        elif e.key() == Qt.Key_Home:
+            self.showPly(0)
+        elif e.key() == Qt.Key_End:
+            self.showPly(len(self.history))
+        else:
+            super(Board, self).keyPressEvent(e)
+
+    def showEvent(self, e):
+        self.moveList.show()
+
+    def isMyTurn(self):
+        return (self.ply % 2 == 1) == self.parent.white
 
     def mousePressEvent(self, e):
+        if e.button() == Qt.RightButton:
+            self.premoves = []
+            self.repaint()
+            return
         self.dragPosition = e.pos()
         square = self.squareAt(e.pos())
         if self.canDragSquare(square):
@@ -1409,16 +1659,18 @@ class Board(QWidget):
             dropSquare = self.squareAt(e.pos())
             if dropSquare == self.draggedSquare:
                 self.onSquareClicked(self.draggedSquare)
+            elif dropSquare and not self.isMyTurn():
+                self.premoves.append(self.premoveFromDragDrop(self.draggedSquare, dropSquare))
             elif dropSquare:
                 move = self.moveFromDragDrop(self.draggedSquare, dropSquare)
                 if move:
-                    self.position.make_move(move)
+                    self.make_move(move)
                     self.parent.move(move)
-                    self.ply += 1
             self.draggedSquare = None
             self.repaint()
 
     def closeEvent(self, *args):
+        self.moveList.close()
         self.parent.stop_game()
 
     def paintEvent(self, event):
@@ -1466,6 +1718,12 @@ class Board(QWidget):
                 else:
                      painter.fillRect(rect, QBrush(self.darkSquareColor))
 
+        # Highlight queued premoves.
+        for move in self.premoves:
+            for square in (move.source, move.target):
+                rect = QRect(square.x * squareSize, (7 - square.y) * squareSize, squareSize, squareSize)
+                painter.fillRect(rect, QBrush(self.premoveColor))
+
         # Draw the inset.
         painter.setPen(QPen(QBrush(darkBorderColor), self.shadowWidth))
         painter.drawLine(0, 0, 0, squareSize * 8)
@@ -1500,7 +1758,7 @@ class Board(QWidget):
         for x in range(0, 8):
             for y in range(0, 8):
                 square = Square.from_x_and_y(x, 7 - y)
-                piece = self.position[square]
+                piece = self.shownPosition()[square]
                 if piece and square != self.draggedSquare:
                     painter.save()
                     painter.translate((x + 0.5) * squareSize, (y + 0.5) * squareSize)
@@ -1539,8 +1797,14 @@ class Board(QWidget):
             return None
 
     def canDragSquare(self, square):
-        if (self.ply % 2 == 0 and self.parent.white) or (self.ply % 2 == 1 and not self.parent.white):
+        if self.viewedPly is not None or square is None:
             return False
+        if not self.isMyTurn():
+            # Premoves may start on an own piece or on a square an earlier
+            # premove moves to.
+            piece = self.position[square]
+            color = 'w' if self.parent.white else 'b'
+            return (piece is not None and piece.color == color) or any(move.target == square for move in self.premoves)
         for move in self.position.get_legal_moves():
             if move.source == square:
                 return True
@@ -1549,6 +1813,17 @@ class Board(QWidget):
     def onSquareClicked(self, square):
         pass
 
+    def premoveFromDragDrop(self, source, target):
+        # The premove is validated when it is played, pawns reaching the
+        # backrank are promoted to queens.
+        piece = self.position[source]
+        for move in self.premoves:
+            if move.target == source:
+                piece = self.position[move.source]
+        if piece is not None and piece.type == 'p' and target.is_backrank():
+            return Move(source, target, 'q')
+        return Move(source, target)
+
     def moveFromDragDrop(self, source, target):
         for move in self.position.get_legal_moves():
             if move.source == source and move.target == target:
@@ -1561,6 +1836,31 @@ class Board(QWidget):
                 return move
 
 
+class MoveList(QListWidget):
+    """Move list of a game. Selecting a row shows that position on the board."""
+
+    def __init__(self, board):
+        super(MoveList, self).__init__()
+        self.board = board
+        self.setWindowTitle('Moves')
+        self.addItem('Start')
+        self.currentRowChanged.connect(self.board.showPly)
+
+    def append(self, san):
+        ply = self.count()
+        number = str((ply + 1) // 2) + ('. ' if ply % 2 else '... ')
+        self.addItem(number + san)
+
+    def truncate(self, ply):
+        while self.count() > ply + 1:
+            self.takeItem(self.count() - 1)
+
+    def select(self, ply):
+        self.blockSignals(True)
+        self.setCurrentRow(ply)
+        self.blockSignals(False)
+
+
 class PromotionDialog(QDialog):
 
     def __init__(self, color, parent=None):
@@ -1577,7 +1877,7 @@ class PromotionDialog(QDialog):
         for i, promotionType in enumerate(self.promotionTypes):
             # Create an icon for the piece.
             piece = Piece.from_color_and_type(color, promotionType)
-            renderer = QSvgRenderer(plugin_super_class.path_to_data('chess') + "classic-pieces/%s-%s.svg" % (piece.full_color, piece.full_type))
+            renderer = piece_renderers()[piece]
             pixmap = QPixmap(32, 32)
             pixmap.fill(Qt.transparent)
             painter = QPainter()
@@ -1606,6 +1906,224 @@ class PromotionDialog(QDialog):
         return self.promotionTypes[self.buttonGroup.checkedId()]
 
 
+def parse_uci_info(line):
+    """Parses an UCI `info` line.
+
+    :param line:
+        A line like `"info depth 12 score cp 35 pv e2e4 e7e5"`.
+
+    :return:
+        A dictionary with the integer fields (`depth`, `seldepth`,
+        `multipv`, `nodes`, `nps`, `time`), `score` as a tuple like
+        `("cp", 35)` or `("mate", -3)` and `pv` as a list of Move
+        objects. Fields missing in the line are missing in the result.
+    """
+    tokens = line.split()[1:]
+    info = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("depth", "seldepth", "multipv", "nodes", "nps", "time") and i + 1 < len(tokens):
+            try:
+                info[token] = int(tokens[i + 1])
+            except ValueError:
+                pass
+            i += 2
+        elif token == "score" and i + 2 < len(tokens):
+            try:
+                info["score"] = (tokens[i + 1], int(tokens[i + 2]))
+            except ValueError:
+                pass
+            i += 3
+        elif token == "pv":
+            pv = []
+            i += 1
+            while i < len(tokens):
+                try:
+                    pv.append(Move.from_uci(tokens[i]))
+                except (AttributeError, ValueError):
+                    break
+                i += 1
+            info["pv"] = pv
+        elif token == "string":
+            break
+        else:
+            i += 1
+    return info
+
+
+class UciEngine(QObject):
+    """Drives a local UCI engine binary.
+
+    The engine runs as an asyncio subprocess on a private event loop
+    thread, so the Qt event loop never waits for engine I/O. Parsed
+    `info` lines and best moves are delivered through signals in the GUI
+    thread. `info` is coalesced, only the latest line is emitted when the
+    engine prints faster than the GUI processes events. The process is
+    started once and reused for every position until `quit()` is called.
+    If the engine exits or doesn't finish the handshake, `error` is
+    emitted and the engine has to be created again.
+
+    :param command:
+        The command line used to launch the engine.
+    :param timeout:
+        Optional. Seconds the engine has for answering `uci` and
+        `isready`.
+    """
+
+    info = pyqtSignal(dict)
+    bestmove = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, command, timeout=10):
+        super(UciEngine, self).__init__()
+        self.command = shlex.split(command)
+        self.timeout = timeout
+        self._process = None
+        self._searching = False
+        self._stale = 0
+        self._closed = False
+        self._quitting = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._spawned = self._call(self._spawn())
+
+    def analyse(self, fen, depth=None):
+        """Starts analysing the position given as FEN. A running search
+        is stopped and its remaining output is discarded.
+
+        :param depth:
+            Optional. Search depth, defaults to an infinite search.
+        """
+        self._call(self._analyse(fen, depth))
+
+    def stop(self):
+        """Stops the current search. The engine process keeps running."""
+        self._call(self._stop())
+
+    def quit(self):
+        """Terminates the engine process and its event loop thread.
+        Calls after the first one do nothing."""
+        if not self._closed:
+            self._call(self._quit())
+            self._closed = True
+
+    def _run_loop(self):
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _call(self, coroutine):
+        if self._closed:
+            coroutine.close()
+            return None
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _send(self, line):
+        self._process.stdin.write(bytes(line + "\n", "utf-8"))
+        await self._process.stdin.drain()
+
+    async def _wait_for(self, token):
+        while True:
+            line = await self._process.stdout.readline()
+            if not line:
+                raise EOFError("Engine exited before sending %s." % token)
+            if str(line, "utf-8", "replace").strip() == token:
+                return
+
+    async def _handshake(self):
+        await self._send("uci")
+        await self._wait_for("uciok")
+        await self._send("isready")
+        await self._wait_for("readyok")
+
+    async def _spawn(self):
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                *self.command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL)
+            await asyncio.wait_for(self._handshake(), self.timeout)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            self._process = None
+            self.error.emit("Engine did not finish the handshake in %d s." % self.timeout)
+            return
+        except (OSError, EOFError) as ex:
+            if self._process is not None and self._process.returncode is None:
+                self._process.kill()
+            self._process = None
+            self.error.emit(str(ex))
+            return
+        self._loop.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            line = await self._process.stdout.readline()
+            if not line:
+                if not self._quitting:
+                    # crashed, a search in progress never gets its best move
+                    self._process = None
+                    self._searching = False
+                    self._stale = 0
+                    self.error.emit("Engine exited unexpectedly.")
+                break
+            line = str(line, "utf-8", "replace").strip()
+            if line.startswith("bestmove"):
+                if self._stale:
+                    self._stale -= 1
+                else:
+                    self._searching = False
+                    tokens = line.split()
+                    self.bestmove.emit(tokens[1] if len(tokens) > 1 else "0000")
+            elif line.startswith("info") and not self._stale:
+                info = parse_uci_info(line)
+                if "score" in info or "pv" in info:
+                    invoke.invoke_coalesced((id(self), "info"), self.info.emit, info)
+
+    async def _stop(self):
+        await asyncio.wrap_future(self._spawned)
+        if self._process is not None and self._searching:
+            self._searching = False
+            self._stale += 1
+            await self._send("stop")
+
+    async def _analyse(self, fen, depth):
+        await self._stop()
+        if self._process is None:
+            return
+        await self._send("position fen " + fen)
+        await self._send("go depth %d" % depth if depth else "go infinite")
+        self._searching = True
+
+    async def _quit(self):
+        self._quitting = True
+        try:
+            if not self._spawned.done():
+                # the engine hangs in the handshake
+                self._spawned.cancel()
+                if self._process is not None:
+                    self._process.kill()
+            else:
+                await self._stop()
+                if self._process is not None:
+                    await self._send("quit")
+            if self._process is not None:
+                try:
+                    await asyncio.wait_for(self._process.wait(), 1)
+                except asyncio.TimeoutError:
+                    self._process.kill()
+                    await self._process.wait()
+        except (OSError, EOFError):
+            pass
+        finally:
+            self._loop.stop()
+
+
+@lazy.measure_startup
 class Chess(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
@@ -1616,6 +2134,10 @@ class Chess(plugin_super_class.PluginSuperClass):
         self.pre = None
         self.last_move = None
         self.is_my_move = False
+        self._resend_job = None
+        self.engine = None
+        self.analysing = False
+        self._engine_command = json.loads(self.load_settings())['engine']
 
     def get_description(self):
         return QApplication.translate("Chess", 'Plugin which allows you to play chess with your friends.')
@@ -1633,12 +2155,16 @@ class Chess(plugin_super_class.PluginSuperClass):
                 self.send_lossless('no', friend_number)
             else:
                 self.send_lossless('yes', friend_number)
+                self.stop_engine()
+                self.release_board()
                 self.board = Board(self)
                 self.board.show()
                 self.game = friend_number
                 self.white = False
                 self.is_my_move = False
         elif data == 'yes' and friend_number == self.game:
+            self.stop_engine()
+            self.release_board()
             self.board = Board(self)
             self.board.show()
             self.board.update_title(True)
@@ -1646,39 +2172,306 @@ class Chess(plugin_super_class.PluginSuperClass):
             self.last_move = None
         elif data == 'no':
             self.game = -1
+        elif data.startswith('takeback '):
+            self.takeback_packet(data[9:], friend_number)
         elif data != self.pre:  # move
             self.pre = data
             self.is_my_move = True
             self.last_move = None
             a = Square.from_x_and_y(ord(data[0]) - ord('a'), ord(data[1]) - ord('1'))
             b = Square.from_x_and_y(ord(data[2]) - ord('a'), ord(data[3]) - ord('1'))
-            self.board.position.make_move(Move(a, b, data[4] if len(data) == 5 else None))
-            self.board.repaint()
+            self.board.make_move(Move(a, b, data[4] if len(data) == 5 else None))
             self.board.update_title(True)
-            self.board.ply += 1
+            self.update_analysis()
+            self.play_premove()
+
+    def release_board(self):
+        """Deletes the board of the previous game. The move list keeps a
+        connection to the board, so without this the widgets of every
+        game would stay in memory."""
+        self.cancel_move()
+        if self.board is None:
+            return
+        board, self.board = self.board, None
+        board.moveList.currentRowChanged.disconnect()
+        board.moveList.deleteLater()
+        board.deleteLater()
+
+    def play_premove(self):
+        if not self.board.premoves:
+            return
+        move = self.board.premoves.pop(0)
+        if self.board.position.is_legal(move):
+            self.board.make_move(move)
+            self.move(move)
+        else:
+            self.board.premoves = []
+            self.board.repaint()
+
+    def takeback_packet(self, data, friend_number):
+        if friend_number != self.game or self.board is None:
+            return
+        if data.startswith('ok '):
+            self.apply_takeback(int(data[3:]))
+        elif data == 'no':
+            QMessageBox.information(None, 'Chess', 'Takeback was declined.')
+        else:
+            ply = int(data)
+            if ply < 0 or ply >= len(self.board.history):
+                return
+            reply = QMessageBox.question(None,
+                                         'Takeback',
+                                         'Your opponent wants to take back the last move. Allow?',
+                                         QMessageBox.Yes,
+                                         QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                self.send_lossless('takeback no', friend_number)
+            else:
+                self.send_lossless('takeback ok ' + str(ply), friend_number)
+                self.apply_takeback(ply)
+
+    def takeback(self):
+        """Asks the opponent to undo moves back to our last turn."""
+        if self.board is None or self.game == -1:
+            return
+        ply = len(self.board.history) - 1
+        if (ply % 2 == 0) != self.white:
+            ply -= 1
+        if ply < 0:
+            return
+        # Stop resending a move that is going to be taken back.
+        self.cancel_move()
+        self.send_lossless('takeback ' + str(ply), self.game)
+
+    def apply_takeback(self, ply):
+        self.cancel_move()
+        self.board.takeback(ply)
+        self.pre = None
+        self.is_my_move = (ply % 2 == 0) == self.white
+        self.board.update_title(self.is_my_move)
+        self.update_analysis()
 
     def start_game(self, num):
+        self.cancel_move()
         self.white = True
         self.send_lossless('new', num)
         self.game = num
 
+    def send_move(self):
+        outbox.send(self, str(self.last_move), self.game, outbox.HIGH, 'move')
+
+    def cancel_move(self):
+        """Drops our move waiting in the outbox and stops resending it,
+        so it can't reach the opponent after a takeback or a new game."""
+        self.last_move = None
+        if self._resend_job is not None:
+            self._resend_job.cancel()
+            self._resend_job = None
+        if self.game != -1:
+            outbox.cancel(self, self.game, 'move')
+
     def resend_move(self):
         if self.is_my_move or self.last_move is None:
+            self._resend_job.cancel()
+            self._resend_job = None
             return
-        self.send_lossless(str(self.last_move), self.game)
-        QTimer.singleShot(1000, self.resend_move)
+        self.send_move()
 
     def stop_game(self):
-        self.last_move = None
+        self.cancel_move()
+        self.stop_engine()
 
     def move(self, move):
         self.is_my_move = False
         self.last_move = move
-        self.send_lossless(str(move), self.game)
+        self.send_move()
         self.board.update_title()
-        QTimer.singleShot(1000, self.resend_move)
+        if self._resend_job is None:
+            self._resend_job = scheduler.call_every(1, self.resend_move)
+        self.update_analysis()
+
+    def stop(self):
+        self.cancel_move()
+        self.stop_engine()
+
+    def close(self):
+        self.cancel_move()
+        self.stop_engine()
+
+    def command(self, command):
+        if command.startswith('engine '):
+            self._engine_command = command[7:].strip()
+            self.save_settings(json.dumps({'engine': self._engine_command}))
+            self.stop_engine()
+        elif command == 'analyse':
+            self.analysing = not self.analysing
+            if self.analysing:
+                self.update_analysis()
+            else:
+                self.stop_engine()
+        elif command == 'takeback':
+            self.takeback()
+        elif command == 'stats on':
+            instrumentation.enable()
+        elif command == 'stats off':
+            instrumentation.disable()
+        elif command == 'stats reset':
+            instrumentation.reset()
+        elif command.startswith('stats dump '):
+            with open(command[11:].strip(), 'w') as fl:
+                fl.write(instrumentation.to_json())
+        elif command == 'stats':
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle(QApplication.translate("Chess", "Chess timings"))
+            msgbox.setText(instrumentation.summary())
+            msgbox.exec_()
+        elif command == 'help':
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle(QApplication.translate("Chess", "List of commands for plugin Chess"))
+            msgbox.setText(QApplication.translate("Chess", """Commands:
+engine <command line>: set UCI engine used for analysis
+analyse: toggle engine analysis of the current game
+takeback: ask the opponent to take back your last move
+stats on / stats off: enable or disable timing of move generation, painting and packets
+stats: show timings
+stats dump <path>: save timings as JSON
+stats reset: clear timings
+help: show this help"""))
+            msgbox.exec_()
+        else:
+            super(Chess, self).command(command)
+
+    def update_analysis(self):
+        if not self.analysing or not self._engine_command or self.board is None:
+            return
+        if self.engine is None:
+            self.engine = UciEngine(self._engine_command)
+            self.engine.info.connect(self.board.set_analysis)
+            self.engine.error.connect(self.engine_error)
+        self.engine.analyse(self.board.position.fen)
+
+    def stop_engine(self):
+        if self.engine is not None:
+            self.engine.info.disconnect()
+            self.engine.quit()
+            self.engine = None
+        if self.board is not None:
+            self.board.analysis = ''
+            self.board.show_title()
+
+    def engine_error(self, message):
+        self.analysing = False
+        self.stop_engine()
+        msgbox = QMessageBox()
+        msgbox.setWindowTitle(QApplication.translate("Chess", "Engine error"))
+        msgbox.setText(message)
+        msgbox.exec_()
 
     def get_menu(self, menu, num):
         act = QAction(QApplication.translate("Chess", "Start chess game"), menu)
         act.triggered.connect(lambda: self.start_game(num))
-        return [act]
+        if self.board is None or num != self.game:
+            return [act]
+        takeback = QAction(QApplication.translate("Chess", "Ask to take back move"), menu)
+        takeback.triggered.connect(self.takeback)
+        return [act, takeback]
+
+
+class Instrumentation(object):
+    """Opt-in timing of the chess hot paths.
+
+    While disabled the instrumented methods are the original functions,
+    so there is no overhead. `enable()` replaces them with wrappers
+    recording into a `profiler.Histogram` per method and `disable()`
+    restores the originals.
+    """
+
+    def __init__(self):
+        self.histograms = collections.OrderedDict()
+        self.__originals = []
+
+    @property
+    def enabled(self):
+        return bool(self.__originals)
+
+    def record(self, name, seconds):
+        if name not in self.histograms:
+            self.histograms[name] = profiler.Histogram()
+        self.histograms[name].add(seconds)
+
+    def reset(self):
+        self.histograms.clear()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.__patch(Position, "get_legal_moves", self.__timed_generator)
+        self.__patch(Position, "make_move", self.__timed_validation)
+        self.__patch(Board, "paintEvent", self.__timed)
+        self.__patch(Board, "squareAt", self.__timed)
+        self.__patch(Chess, "lossless_packet", self.__timed)
+
+    def disable(self):
+        while self.__originals:
+            cls, name, func = self.__originals.pop()
+            setattr(cls, name, func)
+
+    def to_json(self):
+        return json.dumps({name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                          indent=2)
+
+    def summary(self):
+        lines = []
+        for name, histogram in self.histograms.items():
+            data = histogram.to_dict()
+            lines.append("{}: {} calls, mean {} ms, p90 {} ms, max {} ms".format(
+                name, data["count"], data["mean_ms"], data["p90_ms"], data["max_ms"]))
+        return "\n".join(lines) or "No data"
+
+    def __patch(self, cls, name, wrap):
+        func = cls.__dict__[name]
+        self.__originals.append((cls, name, func))
+        setattr(cls, name, wrap(func, cls.__name__ + "." + name))
+
+    def __timed(self, func, name):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    def __timed_validation(self, func, name):
+        def wrapper(position, move, validate=True):
+            if not validate:
+                return func(position, move, False)
+            start = time.perf_counter()
+            try:
+                return func(position, move, True)
+            finally:
+                self.record(name + " (validated)", time.perf_counter() - start)
+        return wrapper
+
+    def __timed_generator(self, func, name):
+        # Only the time spent producing items is counted, not the time
+        # the consumer spends between them.
+        def wrapper(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                self.record(name, elapsed)
+        return wrapper
+
+
+instrumentation = Instrumentation()
@@ -1,22 +1,70 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtCore, QtWidgets
-import json
+from plugin_utils import database, framing, identity, outbox, scheduler
+import hashlib
+import itertools
 
 
+def digest(tox_id):
+    """
+    Short digest of Tox ID. Public key is known to friends, so it only tells whether nospam or checksum changed
+    """
+    return hashlib.sha1(tox_id.upper().encode('ascii')).hexdigest()[:8]
+
+
+def convert_settings(data):
+    if 'id' in data:
+        # old format - list of full Tox IDs
+        data['ids'] = {tox_id[:64]: tox_id[64:] for tox_id in data.pop('id')}
+    return data
+
+
+def open_data(plugin):
+    """
+    Opens settings in plugins' database on first use. settings.json is migrated once, friends' Tox IDs and
+    versions of their plugins are stored in separate namespaces keyed by public key
+    """
+    return database.open_namespace(plugin, id_dicts=('ids', 'versions'), convert=convert_settings)
+
+
+def open_friends_namespace(name):
+    def open_friends(plugin):
+        friends = database.get_database().namespace(plugin.get_short_name() + '_' + name)
+        plugin._data  # settings are migrated first
+        # forget data of removed friends
+        with database.get_database().transaction():
+            for public_key in friends.keys():
+                if plugin._index.number(public_key) is None:
+                    del friends[public_key]
+        return friends
+    return open_friends
+
+
+@lazy.measure_startup
 class CopyableToxId(plugin_super_class.PluginSuperClass):
 
+    _data = lazy.attribute(open_data)
+    _ids = lazy.attribute(open_friends_namespace('ids'))  # public key -> nospam and checksum
+    _versions = lazy.attribute(open_friends_namespace('versions'))  # public key -> protocol version
+
     def __init__(self, *args):
         super(CopyableToxId, self).__init__('CopyableToxId', 'toxid', *args)
-        self._data = json.loads(self.load_settings())
-        self._copy = False
-        self._curr = -1
-        self._timer = QtCore.QTimer()
-        self._timer.timeout.connect(lambda: self.timer())
-        self.load_translator()
+        self._requests = {}  # request id -> (friend number, timeout job)
+        self._friend_requests = {}  # friend number -> list of request ids
+        self._request_ids = itertools.count(1)
+        self._msgbox = None
+        self._asked = set()  # friends asked for full Tox ID after connection, without reply yet
+        self._timeout = 10
+        self._index = identity.get_index(self._tox, self._profile)
+        self._protocol = framing.Protocol(self)
 
+    @lazy.translated
     def get_description(self):
         return QtWidgets.QApplication.translate("TOXID", 'Plugin which allows you to copy TOX ID of your friend easily.')
 
+    @lazy.translated
     def get_window(self):
         inst = self
 
@@ -38,49 +86,122 @@ class CopyableToxId(plugin_super_class.PluginSuperClass):
 
             def update(self):
                 inst._data['send_id'] = self.send.isChecked()
-                inst.save_settings(json.dumps(inst._data))
 
         return Window()
 
+    def get_tox_id(self, public_key):
+        """
+        :return stored Tox ID of friend or None
+        """
+        suffix = self._ids.get(public_key)
+        return public_key + suffix if suffix is not None else None
+
+    def store_tox_id(self, tox_id, friend_number):
+        """
+        Saves Tox ID sent by friend. Only nospam and checksum are stored, public key is the key
+        :return False if Tox ID doesn't belong to the friend
+        """
+        public_key, suffix = tox_id[:64].upper(), tox_id[64:]
+        if public_key != self._index.public_key(friend_number):
+            return False
+        if self._ids.get(public_key) != suffix:
+            self._ids[public_key] = suffix
+        return True
+
     def lossless_packet(self, data, friend_number):
+        message = self._protocol.receive(data, friend_number)
+        if message is None:
+            return
+        if not message.legacy:
+            if message.type == 'digest':
+                self.digest_received(message.payload, friend_number, message.version)
+            return
         if len(data):
-            self._data['id'] = list(filter(lambda x: not x.startswith(data[:64]), self._data['id']))
-            self._data['id'].append(data)
-            if self._copy:
-                self._timer.stop()
-                self._copy = False
-                clipboard = QtWidgets.QApplication.clipboard()
-                clipboard.setText(data)
-            self.save_settings(json.dumps(self._data))
+            if not self.store_tox_id(data, friend_number):
+                return
+            self._asked.discard(friend_number)
+            if self._friend_requests.get(friend_number):
+                for request_id in self._friend_requests.pop(friend_number):
+                    self._requests.pop(request_id)[1].cancel()
+                self.copy(data)
         elif self._data['send_id']:
             self.send_lossless(self._tox.self_get_address(), friend_number)
 
+    def close(self):
+        for _, job in self._requests.values():
+            job.cancel()
+        self._requests.clear()
+        self._friend_requests.clear()
+
+    def copy(self, tox_id):
+        clipboard = QtWidgets.QApplication.clipboard()
+        clipboard.setText(tox_id)
+
+    def request(self, friend_number):
+        """
+        Asks friend for Tox ID, it's copied when reply arrives
+        :return request id
+        """
+        request_id = next(self._request_ids)
+        job = scheduler.call_later(self._timeout, self.request_timeout, request_id)
+        self._requests[request_id] = (friend_number, job)
+        self._friend_requests.setdefault(friend_number, []).append(request_id)
+        outbox.send(self, '', friend_number, outbox.HIGH, 'request')
+        return request_id
+
+    @lazy.translated
     def error(self):
-        msgbox = QtWidgets.QMessageBox()
+        """
+        Shows non modal message box, it can be called from scheduler jobs
+        """
+        self._msgbox = QtWidgets.QMessageBox()
         title = QtWidgets.QApplication.translate("TOXID", "Error")
-        msgbox.setWindowTitle(title.format(self._name))
+        self._msgbox.setWindowTitle(title.format(self._name))
         text = QtWidgets.QApplication.translate("TOXID", "Tox ID cannot be copied")
-        msgbox.setText(text)
-        msgbox.exec_()
-
-    def timer(self):
-        self._copy = False
-        if self._curr + 1:
-            public_key = self._tox.friend_get_public_key(self._curr)
-            self._curr = -1
-            arr = list(filter(lambda x: x.startswith(public_key), self._data['id']))
-            if len(arr):
-                clipboard = QtWidgets.QApplication.clipboard()
-                clipboard.setText(arr[0])
-            else:
-                self.error()
+        self._msgbox.setText(text)
+        self._msgbox.show()
+
+    def request_timeout(self, request_id):
+        friend_number, _ = self._requests.pop(request_id)
+        self._friend_requests[friend_number].remove(request_id)
+        if not self._friend_requests[friend_number]:
+            del self._friend_requests[friend_number]
+        # friend doesn't answer, stored Tox ID is still better than nothing
+        tox_id = self.get_tox_id(self._index.public_key(friend_number))
+        if tox_id is not None:
+            self.copy(tox_id)
         else:
             self.error()
-        self._timer.stop()
+
+    def digest_received(self, friend_digest, friend_number, version):
+        """
+        Friend advertised digest of its Tox ID. Full Tox ID is requested only if stored one differs
+        """
+        public_key = self._index.public_key(friend_number)
+        if public_key is None:
+            return
+        if self._versions.get(public_key) != version:
+            self._versions[public_key] = version
+        tox_id = self.get_tox_id(public_key)
+        if tox_id is None or digest(tox_id) != friend_digest:
+            self.ask(friend_number)
+
+    def ask(self, friend_number):
+        if friend_number not in self._asked:
+            self._asked.add(friend_number)
+            outbox.send(self, '', friend_number, outbox.LOW, 'request')
 
     def friend_connected(self, friend_number):
-        self.send_lossless('', friend_number)
+        self._index.friend_connected(friend_number)
+        self._asked.discard(friend_number)
+        if self._data['send_id']:
+            # request id is constant, so old versions of plugin store the same garbage entry only once
+            self._protocol.send('digest', digest(self._tox.self_get_address()), friend_number, 0, outbox.LOW)
+        if self._versions.get(self._index.public_key(friend_number)) is None:
+            # friend never sent digest - old version of plugin, full Tox ID is requested every time
+            self.ask(friend_number)
 
+    @lazy.translated
     def command(self, text):
         if text == 'copy':
             num = self._profile.get_active_number()
@@ -91,10 +212,10 @@ class CopyableToxId(plugin_super_class.PluginSuperClass):
             if num < 0:
                 return
         elif text == 'enable':
-            self._copy = True
+            self._data['send_id'] = True
             return
         elif text == 'disable':
-            self._copy = False
+            self._data['send_id'] = False
             return
         elif text == 'help':
             msgbox = QtWidgets.QMessageBox()
@@ -111,19 +232,15 @@ help: show this help""")
             return
         else:
             return
-        public_key = self._tox.friend_get_public_key(num)
-        arr = list(filter(lambda x: x.startswith(public_key), self._data['id']))
-        if self._profile.get_friend_by_number(num).status is None and len(arr):
-            clipboard = QtWidgets.QApplication.clipboard()
-            clipboard.setText(arr[0])
+        tox_id = self.get_tox_id(self._index.public_key(num))
+        if self._profile.get_friend_by_number(num).status is None and tox_id is not None:
+            self.copy(tox_id)
         elif self._profile.get_friend_by_number(num).status is not None:
-            self._copy = True
-            self._curr = num
-            self.send_lossless('', num)
-            self._timer.start(2000)
+            self.request(num)
         else:
             self.error()
 
+    @lazy.translated
     def get_menu(self, menu, num):
         act = QtWidgets.QAction(QtWidgets.QApplication.translate("TOXID", "Copy TOX ID"), menu)
         friend = self._profile.get_friend(num)
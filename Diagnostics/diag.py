@@ -0,0 +1,127 @@
+import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
+import json
+from PyQt5 import QtWidgets
+from plugin_utils import lag, memory, profiler, scheduler, shutdown
+
+
+@lazy.measure_startup
+class Diagnostics(plugin_super_class.PluginSuperClass):
+
+    def __init__(self, *args):
+        super(Diagnostics, self).__init__('Diagnostics', 'diag', *args)
+        self._deadline = json.loads(self.load_settings())['shutdown_deadline_ms'] / 1000
+        self._report_path = plugin_super_class.path_to_data(self._short_name) + 'shutdown.json'
+        self._last_shutdown = shutdown.load_report(self._report_path)
+        self._watching = False
+
+    def start(self):
+        if not self._watching:
+            self._watching = True
+            # other plugins may be not loaded yet
+            scheduler.call_later(0, self.watch_shutdown)
+
+    def watch_shutdown(self):
+        # report of this session's shutdown is saved once after the last close(), it's shown on next start
+        shutdown.watch(profiler.host_plugins(), self._deadline,
+                       lambda report: shutdown.save_report(report, self._report_path))
+
+    def get_description(self):
+        return QtWidgets.QApplication.translate("diag", 'Plugin which measures performance of other plugins.')
+
+    def close(self):
+        profiler.profiler.export_every(None, None)
+        profiler.profiler.disable()
+        lag.monitor.stop()
+        if memory.tracker.is_tracing():
+            memory.tracker.stop()
+
+    def show(self, title, text):
+        msgbox = QtWidgets.QMessageBox()
+        msgbox.setWindowTitle(title)
+        msgbox.setText(text)
+        msgbox.exec_()
+
+    def command(self, command):
+        prof = profiler.profiler
+        if command == 'profile on':
+            prof.enable(profiler.host_plugins())
+        elif command == 'profile off':
+            prof.disable()
+        elif command == 'profile reset':
+            prof.reset()
+        elif command == 'profile':
+            self.show(QtWidgets.QApplication.translate("diag", "Plugin hooks timings"), prof.summary())
+        elif command.startswith('profile dump '):
+            with open(command[13:].strip(), 'w') as fl:
+                fl.write(prof.to_json())
+        elif command == 'profile export off':
+            prof.export_every(None, None)
+        elif command.startswith('profile export '):
+            # profile export <path> [interval]
+            args = command[15:].split()
+            prof.export_every(args[0], float(args[1]) if len(args) > 1 else 15.0)
+        elif command == 'lag on' or command.startswith('lag on '):
+            if command[7:].strip():
+                try:
+                    threshold = float(command[7:]) / 1000
+                except ValueError:
+                    self.show(QtWidgets.QApplication.translate("diag", "Wrong command"),
+                              QtWidgets.QApplication.translate("diag", "Usage: lag on [threshold ms]"))
+                    return
+                lag.monitor.threshold = threshold
+            lag.monitor.start()
+        elif command == 'lag off':
+            lag.monitor.stop()
+        elif command == 'lag reset':
+            lag.monitor.reset()
+        elif command == 'lag':
+            self.show(QtWidgets.QApplication.translate("diag", "Main thread lag"), lag.monitor.summary())
+        elif command.startswith('lag dump '):
+            with open(command[9:].strip(), 'w') as fl:
+                fl.write(json.dumps(lag.monitor.to_dict(), indent=2))
+        elif command == 'memory on':
+            memory.tracker.start(profiler.host_plugins())
+        elif command == 'memory off':
+            memory.tracker.stop()
+        elif command == 'memory':
+            if memory.tracker.is_tracing():
+                self.show(QtWidgets.QApplication.translate("diag", "Memory usage"), memory.tracker.summary())
+        elif command.startswith('memory dump '):
+            if memory.tracker.is_tracing():
+                with open(command[12:].strip(), 'w') as fl:
+                    fl.write(memory.tracker.to_json())
+        elif command == 'shutdown':
+            if self._last_shutdown is None:
+                text = QtWidgets.QApplication.translate("diag", "No shutdown was recorded yet")
+            else:
+                report = self._last_shutdown
+                text = '\n'.join('{}: {} ms'.format(item['plugin'], item['ms']) for item in report['closes'])
+                text += '\nTotal: {} ms, deadline {} ms'.format(report['total_ms'], report['deadline_ms'])
+                if report['overran']:
+                    text += '\nOverran deadline: ' + ', '.join(report['overran'])
+            self.show(QtWidgets.QApplication.translate("diag", "Previous shutdown"), text)
+        elif command == 'startup':
+            self.show(QtWidgets.QApplication.translate("diag", "Startup of plugins"), lazy.report.format())
+        elif command == 'help':
+            self.show(QtWidgets.QApplication.translate("diag", "List of commands for plugin Diagnostics"),
+                      QtWidgets.QApplication.translate("diag", """Commands:
+profile on / profile off: enable or disable timing of plugins' hooks
+profile: show timings
+profile reset: clear timings
+profile dump <path>: save timings as JSON
+profile export <path> [interval]: write timings in Prometheus text format every interval seconds (15 by default)
+profile export off: stop writing timings
+lag on [threshold ms] / lag off: enable or disable main thread lag monitoring, 100 ms threshold by default
+lag: show main thread lag and timings of calls posted from other threads
+lag reset: clear lag stats
+lag dump <path>: save lag stats and warnings as JSON
+memory on / memory off: enable or disable tracing of memory allocations (slows down the client)
+memory: show memory allocated by each plugin, growth since previous report and plugins' objects
+memory dump <path>: save memory report as JSON
+shutdown: show how long plugins took to close on previous exit
+startup: show time plugins spent in import, construction, start() and loading settings and translators on first use
+help: show this help"""))
+        else:
+            super(Diagnostics, self).command(command)
@@ -1,7 +1,10 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
 from PyQt5 import QtGui, QtCore, QtWidgets
 
 
+@lazy.measure_startup
 class SearchPlugin(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
@@ -0,0 +1,267 @@
+"""Offline benchmarks for the chess engine of the Chess plugin.
+
+    chess_bench.py epd SUITE.epd [--nodes N | --seconds S] [--jobs J] [--json PATH]
+    chess_bench.py perft DEPTH [--fen FEN]
+
+The epd command runs a tactical test suite (for example WAC) with a
+fixed node or time budget per position and reports solved positions,
+nodes per second and time to solution. A position counts as solved when
+the best move is one of the `bm` moves and none of the `am` moves. The
+search lives in this script, the plugin itself has no use for it.
+
+chess.py imports plugin_super_class, so Toxygen's source directory has
+to be on PYTHONPATH. plugin_utils is found in the repository root.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+# chess.py imports plugin_utils from the repository root
+for path in (ROOT, os.path.join(ROOT, 'Chess')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import chess
+
+
+def parse_epd(line):
+    """Parses an EPD line into a dictionary with the full FEN and the
+    operations, each operation being a list of operands."""
+    tokens = line.split(None, 4)
+    if len(tokens) < 4:
+        raise ValueError('Invalid EPD: ' + repr(line))
+    operations = {}
+    rest = tokens[4] if len(tokens) == 5 else ''
+    for operation in rest.split(';'):
+        operation = operation.strip()
+        if not operation:
+            continue
+        opcode, _, operands = operation.partition(' ')
+        operands = operands.strip()
+        if operands.startswith('"'):
+            operations[opcode] = [operands.strip('"')]
+        else:
+            operations[opcode] = operands.split()
+    half_moves = operations.get('hmvc', ['0'])[0]
+    move_number = operations.get('fmvn', ['1'])[0]
+    return {
+        'fen': ' '.join(tokens[:4] + [half_moves, move_number]),
+        'id': operations.get('id', [line[:40]])[0],
+        'operations': operations
+    }
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class Search(object):
+    """Iterative deepening alpha-beta search with a material evaluation,
+    used only by the EPD runner.
+
+    Captures are tried first, ordered by most valuable victim and least
+    valuable attacker.
+
+    :param nodes:
+        Optional. Stop after searching this many nodes.
+    :param seconds:
+        Optional. Stop after this many seconds.
+    :param max_depth:
+        Optional. The deepest iteration to search.
+    """
+
+    PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+    MATE = 100000
+
+    def __init__(self, nodes=None, seconds=None, max_depth=64):
+        self.node_limit = nodes
+        self.seconds = seconds
+        self.max_depth = max_depth
+        self.nodes = 0
+        self.__deadline = None
+
+    def run(self, position, callback=None):
+        """Searches the position until the budget is used up.
+
+        :param callback:
+            Optional. Called as `callback(depth, score, move, nodes,
+            seconds)` after each completed iteration.
+
+        :return:
+            A tuple of the best move (or `None` if there are no legal
+            moves), its score in centipawns from the view of the side to
+            move and the last completed depth.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.__deadline = start + self.seconds if self.seconds else None
+        moves = self.__ordered(position, list(position.get_legal_moves()))
+        best, best_score, completed = (moves[0] if moves else None), 0, 0
+        for depth in range(1, self.max_depth + 1):
+            if not moves:
+                break
+            try:
+                score, move = self.__root(position, moves, depth)
+            except SearchAborted:
+                break
+            best, best_score, completed = move, score, depth
+            # Search the best move first in the next iteration.
+            moves.remove(move)
+            moves.insert(0, move)
+            if callback:
+                callback(depth, score, move, self.nodes, time.perf_counter() - start)
+            if abs(score) >= Search.MATE - self.max_depth:
+                break
+        return best, best_score, completed
+
+    def evaluate(self, position):
+        """:return: The material balance from the view of the side to move."""
+        score = 0
+        for color, sign in (('w', 1), ('b', -1)):
+            for type, count in position.get_piece_counts(color).items():
+                score += sign * count * Search.PIECE_VALUES[type]
+        return score if position.turn == 'w' else -score
+
+    def __count_node(self):
+        self.nodes += 1
+        if self.node_limit and self.nodes > self.node_limit:
+            raise SearchAborted()
+        if self.__deadline and not self.nodes & 31 and time.perf_counter() > self.__deadline:
+            raise SearchAborted()
+
+    def __ordered(self, position, moves):
+        def key(move):
+            captured = position[move.target]
+            if not captured:
+                return 0
+            return -10 * Search.PIECE_VALUES[captured.type] + Search.PIECE_VALUES[position[move.source].type] // 100
+        return sorted(moves, key=key)
+
+    def __root(self, position, moves, depth):
+        alpha, best = -Search.MATE - 1, moves[0]
+        for move in moves:
+            score = -self.__negamax(position.copy().make_move(move, False), depth - 1, -Search.MATE - 1, -alpha, 1)
+            if score > alpha:
+                alpha, best = score, move
+        return alpha, best
+
+    def __negamax(self, position, depth, alpha, beta, ply):
+        self.__count_node()
+        if depth == 0:
+            return self.evaluate(position)
+        moves = list(position.get_legal_moves())
+        if not moves:
+            return -(Search.MATE - ply) if position.is_check() else 0
+        for move in self.__ordered(position, moves):
+            score = -self.__negamax(position.copy().make_move(move, False), depth - 1, -beta, -alpha, ply + 1)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+
+def solve(entry, nodes, seconds):
+    position = chess.Position(entry['fen'])
+    operations = entry['operations']
+    best_moves = [position.get_move_from_san(san) for san in operations.get('bm', [])]
+    avoid_moves = [position.get_move_from_san(san) for san in operations.get('am', [])]
+
+    def is_solution(move):
+        if best_moves and move not in best_moves:
+            return False
+        return move not in avoid_moves
+
+    solved_since = []
+
+    def iteration(depth, score, move, searched, elapsed):
+        if not is_solution(move):
+            del solved_since[:]
+        elif not solved_since:
+            solved_since.append(elapsed)
+
+    search = Search(nodes=nodes, seconds=seconds)
+    start = time.perf_counter()
+    move, score, depth = search.run(position, iteration)
+    elapsed = time.perf_counter() - start
+    solved = move is not None and is_solution(move)
+    return {
+        'id': entry['id'],
+        'move': position.get_move_info(move).san if move else None,
+        'solved': solved,
+        'score': score,
+        'depth': depth,
+        'nodes': search.nodes,
+        'seconds': elapsed,
+        'time_to_solution': solved_since[0] if solved and solved_since else None
+    }
+
+
+def run_epd(path, nodes, seconds, jobs):
+    with open(path) as fl:
+        entries = [parse_epd(line) for line in fl if line.strip() and not line.startswith('#')]
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(solve, entry, nodes, seconds) for entry in entries]
+            return [future.result() for future in futures]
+    return [solve(entry, nodes, seconds) for entry in entries]
+
+
+def summarize(results):
+    nodes = sum(result['nodes'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    times = [result['time_to_solution'] for result in results if result['time_to_solution'] is not None]
+    return {
+        'positions': len(results),
+        'solved': sum(1 for result in results if result['solved']),
+        'nodes': nodes,
+        'seconds': round(seconds, 3),
+        'nps': int(nodes / seconds) if seconds else 0,
+        'mean_time_to_solution': round(sum(times) / len(times), 3) if times else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chess engine benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    epd = commands.add_parser('epd', help='run an EPD test suite')
+    epd.add_argument('suite')
+    epd.add_argument('--nodes', type=int, default=None, help='node budget per position')
+    epd.add_argument('--seconds', type=float, default=None, help='time budget per position')
+    epd.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    epd.add_argument('--json', default=None, help='write results as JSON to this path')
+    perft = commands.add_parser('perft', help='count leaf nodes of the move tree')
+    perft.add_argument('depth', type=int)
+    perft.add_argument('--fen', default=chess.START_FEN)
+    args = parser.parse_args()
+
+    if args.command == 'perft':
+        start = time.perf_counter()
+        count = chess.perft(chess.Position(args.fen), args.depth)
+        elapsed = time.perf_counter() - start
+        print('perft({}) = {} in {:.3f} s ({:.0f} nodes/s)'.format(args.depth, count, elapsed, count / elapsed))
+    elif args.command == 'epd':
+        if args.nodes is None and args.seconds is None:
+            args.nodes = 10000
+        results = run_epd(args.suite, args.nodes, args.seconds, args.jobs)
+        for result in results:
+            print('{:<16} {:<8} {:<7} depth {:<3} nodes {:<8} {:.3f} s'.format(
+                result['id'], 'solved' if result['solved'] else 'failed', str(result['move']),
+                result['depth'], result['nodes'], result['seconds']))
+        summary = summarize(results)
+        print('Solved {solved}/{positions}, {nodes} nodes in {seconds} s ({nps} nodes/s), '
+              'mean time to solution {mean_time_to_solution} s'.format(**summary))
+        if args.json:
+            with open(args.json, 'w') as fl:
+                json.dump({'summary': summary, 'results': results}, fl, indent=2)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""Stand-ins for Toxygen objects, so plugins can be loaded and driven
+without a running client.
+
+    harness = Harness(friends=10)
+    toxid = harness.load('CopyableToxId', 'toxid', 'CopyableToxId')
+    toxid.lossless_packet(harness.tox.friend_address(3), 3)
+
+Importing this module registers a fake `plugin_super_class` module with
+the same API as Toxygen's one. Plugin data (settings.json) is copied to
+a temporary folder, so the repository is never modified. PyQt5 is still
+required, an offscreen QApplication is created on first use.
+"""
+
+import ast
+import binascii
+import collections
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+LOSSLESS_FIRST_BYTE = 200
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_data_path = tempfile.mkdtemp(prefix='toxygen_plugins_')
+
+# short name -> number of save_settings() calls
+settings_writes = collections.Counter()
+
+
+def path_to_data(name):
+    return os.path.join(_data_path, name) + '/'
+
+
+def encode_packet(short_name, data):
+    """Builds a lossless packet the way Toxygen does: first byte, length
+    of the plugin's short name, short name, data."""
+    return bytes([LOSSLESS_FIRST_BYTE, len(short_name)]) + bytes(short_name + data, 'utf-8')
+
+
+def decode_packet(packet):
+    """:return: A tuple (short name, data). Like Toxygen, data is decoded
+    byte by byte."""
+    length = packet[1]
+    name = ''.join(chr(x) for x in packet[2:length + 2])
+    return name, ''.join(chr(x) for x in packet[length + 2:])
+
+
+class PluginSuperClass(object):
+    """Copy of Toxygen's plugin base class API."""
+
+    is_plugin = True
+
+    def __init__(self, name, short_name, tox=None, profile=None, settings=None, encrypt_save=None):
+        self._name = name
+        self._short_name = short_name
+        self._tox = tox
+        self._profile = profile
+        self._settings = settings
+        self._encrypt_save = encrypt_save
+
+    def get_name(self):
+        return self._name
+
+    def get_short_name(self):
+        return self._short_name
+
+    def get_description(self):
+        return self.__doc__ or ''
+
+    def get_menu(self, menu, row_number):
+        return []
+
+    def get_message_menu(self, menu, selected_text):
+        return []
+
+    def get_window(self):
+        return None
+
+    def set_window(self, window):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def command(self, command):
+        pass
+
+    def load_translator(self):
+        pass
+
+    def load_settings(self):
+        with open(path_to_data(self._short_name) + 'settings.json', 'rb') as fl:
+            return str(fl.read(), 'utf-8')
+
+    def save_settings(self, data):
+        settings_writes[self._short_name] += 1
+        with open(path_to_data(self._short_name) + 'settings.json', 'wb') as fl:
+            fl.write(bytes(data, 'utf-8'))
+
+    def lossless_packet(self, data, friend_number):
+        pass
+
+    def lossy_packet(self, data, friend_number):
+        pass
+
+    def send_lossless(self, data, friend_number):
+        self._tox.friend_send_lossless_packet(friend_number, encode_packet(self._short_name, data))
+
+    def send_lossy(self, data, friend_number):
+        pass
+
+    def friend_connected(self, friend_number):
+        pass
+
+
+plugin_super_class = types.ModuleType('plugin_super_class')
+plugin_super_class.PluginSuperClass = PluginSuperClass
+plugin_super_class.path_to_data = path_to_data
+plugin_super_class.MAX_SHORT_NAME_LENGTH = 5
+plugin_super_class.LOSSLESS_FIRST_BYTE = LOSSLESS_FIRST_BYTE
+sys.modules['plugin_super_class'] = plugin_super_class
+
+
+def read_manifest(path):
+    """:return: A tuple (class name, name, short name) of the plugin
+    class in plugin's source, found without importing it, or None."""
+    with open(path, encoding='utf-8') as fl:
+        tree = ast.parse(fl.read(), path)
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        if not any(isinstance(base, ast.Attribute) and base.attr == 'PluginSuperClass' for base in node.bases):
+            continue
+        for call in ast.walk(node):
+            # super(...).__init__('Name', 'short', *args)
+            if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) \
+                    and call.func.attr == '__init__' and len(call.args) >= 2:
+                try:
+                    name, short_name = ast.literal_eval(call.args[0]), ast.literal_eval(call.args[1])
+                except ValueError:
+                    continue
+                return node.name, name, short_name
+    return None
+
+
+def random_key(rng, length=32):
+    return binascii.hexlify(bytes(rng.getrandbits(8) for _ in range(length))).decode('ascii').upper()
+
+
+class FakeFriend(object):
+
+    def __init__(self, number, tox_id, name):
+        self.number = number
+        self.tox_id = tox_id
+        self.name = name
+        self.status = 0  # None when offline
+
+    def load_avatar(self):
+        pass
+
+
+class FakeTox(object):
+    """Part of the Tox API used by plugins. Sent packets are stored in
+    `sent` as (friend number, packet) tuples."""
+
+    def __init__(self, address, friends):
+        self._address = address
+        self._friends = friends
+        self._deleted = set()  # numbers of deleted friends, reused by friend_add_norequest()
+        self.sent = []
+        self.friend_message_cb = self._friend_message
+
+    def self_get_address(self):
+        return self._address
+
+    def self_get_friend_list(self):
+        return [friend.number for friend in self._friends if friend.number not in self._deleted]
+
+    def self_get_friend_list_size(self):
+        return len(self._friends) - len(self._deleted)
+
+    def friend_get_public_key(self, friend_number):
+        if friend_number in self._deleted:
+            raise ValueError(friend_number)
+        return self._friends[friend_number].tox_id[:64]
+
+    def friend_by_public_key(self, public_key):
+        for friend in self._friends:
+            if friend.tox_id[:64] == public_key and friend.number not in self._deleted:
+                return friend.number
+        raise ValueError(public_key)
+
+    def friend_add_norequest(self, public_key):
+        """Adds friend with the lowest free number, like Tox does. Friend
+        object in the shared list is replaced."""
+        number = min(self._deleted) if self._deleted else len(self._friends)
+        friend = FakeFriend(number, public_key[:64], 'Friend {}'.format(number))
+        if number < len(self._friends):
+            self._friends[number] = friend
+            self._deleted.remove(number)
+        else:
+            self._friends.append(friend)
+        return number
+
+    def friend_add(self, address, message):
+        return self.friend_add_norequest(address)
+
+    def friend_delete(self, friend_number):
+        self._deleted.add(friend_number)
+        return True
+
+    def friend_address(self, friend_number):
+        """Not a Tox method: full address of a friend, as sent by the
+        CopyableToxId plugin."""
+        return self._friends[friend_number].tox_id + '00000000' + '0000'
+
+    def friend_send_lossless_packet(self, friend_number, packet):
+        self.sent.append((friend_number, packet))
+        return True
+
+    def _friend_message(self, tox, friend_number, message_type, message, size, user_data):
+        pass
+
+    def callback_friend_message(self, callback, user_data):
+        self.friend_message_cb = callback
+
+
+class FakeProfile(object):
+    """Part of Toxygen's Profile used by plugins. Calls with side effects
+    are logged in `log`."""
+
+    def __init__(self, tox_id, friends):
+        self.tox_id = tox_id
+        self.name = 'Benchmark'
+        self.status = 0
+        self.status_message = b'Running benchmarks'
+        self._contacts = friends
+        self._active = -1
+        self.log = []
+
+    def get_friend_by_number(self, number):
+        return self._contacts[number] if 0 <= number < len(self._contacts) else None
+
+    def get_friend(self, num):
+        return self._contacts[num]
+
+    def get_active_number(self):
+        return self._active
+
+    def set_status(self, status):
+        self.status = status
+
+    def set_status_message(self, message):
+        self.status_message = message
+
+    def send_message(self, text, friend_number=None):
+        self.log.append(('send_message', friend_number, text))
+
+    def send_inline(self, data, file_name, friend_number=None):
+        self.log.append(('send_inline', friend_number, file_name))
+
+    def send_screenshot(self, data):
+        self.log.append(('send_screenshot', None, len(data)))
+
+    def incoming_call(self, audio, video, friend_number):
+        self.log.append(('incoming_call', friend_number, (audio, video)))
+
+    def accept_call(self, friend_number, audio, video):
+        self.log.append(('accept_call', friend_number, (audio, video)))
+
+    def stop_call(self, friend_number, by_friend):
+        self.log.append(('stop_call', friend_number, by_friend))
+
+    def update(self):
+        pass
+
+
+class FakeSettings(dict):
+
+    def __init__(self):
+        super(FakeSettings, self).__init__()
+        self.name = 'benchmark'
+
+
+class FakeEncryptSave(object):
+    """Reversible stand-in for ToxES, password is always set."""
+
+    def has_password(self):
+        return True
+
+    def pass_encrypt(self, data):
+        return bytes(x ^ 0x5a for x in data)
+
+    def pass_decrypt(self, data):
+        return bytes(x ^ 0x5a for x in data)
+
+
+_application = None
+
+
+def application():
+    """:return: QApplication, created with the offscreen platform if there
+    is none."""
+    global _application
+    from PyQt5 import QtWidgets
+    if QtWidgets.QApplication.instance() is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        _application = QtWidgets.QApplication(sys.argv[:1])
+    return QtWidgets.QApplication.instance()
+
+
+class Harness(object):
+    """Fake Tox, profile, settings and encrypt_save with `friends`
+    friends. Friend public keys are deterministic for a given seed."""
+
+    def __init__(self, friends=10, seed=0):
+        rng = random.Random(seed)
+        self.friends = [FakeFriend(i, random_key(rng), 'Friend {}'.format(i)) for i in range(friends)]
+        address = random_key(rng) + '01234567' + 'ABCD'
+        self.tox = FakeTox(address, self.friends)
+        self.profile = FakeProfile(address, self.friends)
+        self.settings = FakeSettings()
+        self.encrypt_save = FakeEncryptSave()
+        self.plugins = {}
+
+    def args(self):
+        return self.tox, self.profile, self.settings, self.encrypt_save
+
+    def load(self, folder, module_name, class_name, settings=None):
+        """Imports plugin from the repository folder and creates it.
+
+        :param settings: If not None, a dictionary written as the
+            plugin's settings.json instead of the repository's one.
+        """
+        application()
+        path = os.path.join(ROOT, folder)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+        module = importlib.import_module(module_name)
+        cls = getattr(module, class_name)
+        short_name = self._short_name(cls)
+        data = path_to_data(short_name)
+        if not os.path.isdir(data):
+            source = os.path.join(path, short_name)
+            if os.path.isdir(source):
+                shutil.copytree(source, data)
+            else:
+                os.makedirs(data)
+        if settings is not None:
+            with open(data + 'settings.json', 'w') as fl:
+                json.dump(settings, fl)
+        plugin = cls(*self.args())
+        self.plugins[short_name] = plugin
+        return plugin
+
+    @staticmethod
+    def _short_name(cls):
+        manifest = read_manifest(sys.modules[cls.__module__].__file__)
+        return manifest[2]
@@ -0,0 +1,331 @@
+"""Load simulator driving many virtual friends against plugins.
+
+    load_sim.py friends [--friends N] [--seconds S] [--plugins LIST] [--storm]
+                        [--connects R] [--disconnects R] [--messages R]
+                        [--seed SEED] [--json PATH]
+    load_sim.py chess [--plies N] [--seed SEED]
+
+The friends command connects and disconnects virtual friends, answers
+plugin requests the way the same plugin on the friend's side would and
+sends messages to Bot. Time is simulated: plugins' scheduler jobs run on
+a deterministic clock advancing in steps, so a run takes as long as the
+plugins' code needs, and runs with the same seed are identical.
+The report shows per plugin packets sent, settings writes, scheduled
+jobs alive, memory allocated by plugin's code and main-thread time.
+
+The chess command plays a random game between two Chess plugins, each
+with its own fake Tox, connected through a loopback.
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+import harness
+from CopyableToxId import toxid
+from plugin_utils import database, framing, profiler, scheduler, shutdown
+from plugin_utils.settings import SettingsStore
+
+# short name -> (folder, module, class)
+PLUGINS = collections.OrderedDict([
+    ('toxid', ('CopyableToxId', 'toxid', 'CopyableToxId')),
+    ('bday', ('BirthDay', 'bday', 'BirthDay')),
+    ('bot', ('Bot', 'bot', 'Bot')),
+    ('aans', ('AutoAnswer', 'aans', 'AutoAnswer')),
+    ('chess', ('Chess', 'chess', 'Chess'))
+])
+
+
+class Clock(object):
+    """Deterministic clock and the scheduler using it."""
+
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+        self.scheduler = scheduler.Scheduler(clock=lambda: self.now, use_timer=False)
+        scheduler._scheduler = self.scheduler
+
+    def tick(self):
+        self.now += self.step
+        self.scheduler.run_due()
+
+
+class Simulator(object):
+    """Virtual friends of one fake profile."""
+
+    def __init__(self, friends, plugins, step=0.1, seed=0):
+        self.rng = random.Random(seed)
+        self.clock = Clock(step)
+        self.harness = harness.Harness(friends, seed)
+        self.harness.profile.status = 1  # away, so Bot answers
+        for friend in self.harness.friends:
+            friend.status = None
+        self.birthdays = {friend.number: '{:02}.{:02}.{}'.format(self.rng.randint(1, 28), self.rng.randint(1, 12),
+                                                                 self.rng.randint(1950, 2010))
+                          for friend in self.harness.friends}
+        self.packets = collections.Counter()
+        self.received = collections.Counter()
+        self.time = collections.Counter()
+        self.events = collections.Counter()
+        self.profiler = profiler.Profiler()
+        self.plugins = collections.OrderedDict()
+        tracemalloc.start()
+        for name in plugins:
+            self.plugins[name] = self.harness.load(*PLUGINS[name])
+        self.profiler.enable(self.plugins)
+        self.clock.scheduler.monitor = self
+        for plugin in self.plugins.values():
+            plugin.start()
+        if 'bot' in self.plugins:
+            # Bot hooks messages after a 10 s QTimer, which doesn't run without event loop
+            self.plugins['bot'].initialize()
+
+    def owner(self, fn):
+        """:return: Short name of the plugin owning a scheduled callable."""
+        instance = getattr(fn, '__self__', None)
+        if instance is None:
+            return getattr(fn, '__module__', '?')
+        for name, plugin in self.plugins.items():
+            if instance is plugin or any(value is instance for value in plugin.__dict__.values()):
+                return name
+        return type(instance).__name__
+
+    def record(self, fn, lateness, duration):
+        self.time[self.owner(fn)] += duration
+
+    def online(self):
+        return [friend for friend in self.harness.friends if friend.status is not None]
+
+    def offline(self):
+        return [friend for friend in self.harness.friends if friend.status is None]
+
+    def connect(self, friend):
+        friend.status = 0
+        self.events['connect'] += 1
+        for plugin in self.plugins.values():
+            plugin.friend_connected(friend.number)
+
+    def disconnect(self, friend):
+        friend.status = None
+        self.events['disconnect'] += 1
+
+    def message(self, friend):
+        self.events['message'] += 1
+        text = bytes('Hello {}'.format(self.events['message']), 'utf-8')
+        self.harness.tox.friend_message_cb(self.harness.tox, friend.number, 0, text, len(text), None)
+
+    def reply(self, name, data, friend_number):
+        """:return: Answer of the friend's plugin or None."""
+        if name == 'toxid' and framing.parse_frame(data) is not None:
+            # friends run the same version of CopyableToxId and advertise their digests
+            address = self.harness.tox.friend_address(friend_number)
+            return framing.make_frames('digest', toxid.digest(address), 0, 1000)[0]
+        if data:
+            return None
+        if name == 'toxid':
+            return self.harness.tox.friend_address(friend_number)
+        if name == 'bday':
+            return self.birthdays[friend_number]
+        return None
+
+    def deliver(self):
+        while self.harness.tox.sent:
+            sent, self.harness.tox.sent = self.harness.tox.sent, []
+            for friend_number, packet in sent:
+                name, data = harness.decode_packet(packet)
+                self.packets[name] += 1
+                answer = self.reply(name, data, friend_number)
+                friend = self.harness.friends[friend_number]
+                if answer is not None and friend.status is not None and name in self.plugins:
+                    self.received[name] += 1
+                    self.plugins[name].lossless_packet(answer, friend_number)
+
+    def events_count(self, rate):
+        expected = rate * self.clock.step
+        return int(expected) + (self.rng.random() < expected - int(expected))
+
+    def run(self, seconds, connects, disconnects, messages, storm=False):
+        """Simulates `seconds` of time. Rates are events per second.
+
+        Disconnections happen after packets of the step are delivered, so
+        friends connected in a step always exchange packets."""
+        if storm:
+            for friend in self.offline():
+                self.connect(friend)
+        for _ in range(int(seconds / self.clock.step)):
+            for _ in range(self.events_count(connects)):
+                offline = self.offline()
+                if offline:
+                    self.connect(self.rng.choice(offline))
+            for _ in range(self.events_count(messages)):
+                online = self.online()
+                if online:
+                    self.message(self.rng.choice(online))
+            self.clock.tick()
+            harness.application().processEvents()
+            self.deliver()
+            for _ in range(self.events_count(disconnects)):
+                online = self.online()
+                if online:
+                    self.disconnect(self.rng.choice(online))
+
+    def memory(self):
+        """:return: Dictionary short name -> bytes allocated by code in
+        the plugin's folder and still alive."""
+        snapshot = tracemalloc.take_snapshot()
+        folders = {name: os.path.realpath(os.path.join(harness.ROOT, PLUGINS[name][0])) + os.sep
+                   for name in self.plugins}
+        result = collections.Counter()
+        for stat in snapshot.statistics('filename'):
+            filename = os.path.realpath(stat.traceback[0].filename)
+            for name, folder in folders.items():
+                if filename.startswith(folder):
+                    result[name] += stat.size
+        return result
+
+    def report(self):
+        for plugin in self.plugins.values():
+            store = plugin.__dict__.get('_data')
+            if hasattr(store, 'flush'):
+                store.flush()
+        hooks = self.profiler.to_dict()
+        memory = self.memory()
+        jobs = collections.Counter(self.owner(job.fn) for job in self.clock.scheduler.jobs())
+        result = {
+            'seconds': self.clock.now,
+            'events': dict(self.events),
+            'replies_sent': sum(1 for entry in self.harness.profile.log if entry[0] == 'send_message'),
+            'plugins': {}
+        }
+        for name, plugin in self.plugins.items():
+            # settings stores and database namespaces count their writes
+            writes = sum(value.writes for value in plugin.__dict__.values()
+                         if isinstance(value, (SettingsStore, database.Namespace)))
+            result['plugins'][name] = {
+                'packets_sent': self.packets[name],
+                'packets_received': self.received[name],
+                'settings_writes': harness.settings_writes[name] + writes,
+                'jobs_alive': jobs[name],
+                'memory_kb': round(memory[name] / 1024, 1),
+                'hooks_ms': round(sum(hook['total_ms'] for hook in hooks.get(name, {}).values()), 3),
+                'jobs_ms': round(self.time[name] * 1000, 3)
+            }
+        return result
+
+
+def exchanged(result):
+    """:return: True if plugins received any packets or Bot replied to
+    any message, otherwise the report measured nothing."""
+    return result['replies_sent'] > 0 or any(stats['packets_received'] for stats in result['plugins'].values())
+
+
+def format_report(result):
+    lines = ['Simulated {:.0f} s, events: {}'.format(result['seconds'], ', '.join(
+        '{} {}'.format(count, name) for name, count in sorted(result['events'].items()))),
+        '{:<8}{:>10}{:>10}{:>10}{:>8}{:>12}{:>12}{:>12}'.format(
+            'Plugin', 'sent', 'received', 'writes', 'jobs', 'memory KB', 'hooks ms', 'jobs ms')]
+    for name, stats in result['plugins'].items():
+        lines.append('{:<8}{:>10}{:>10}{:>10}{:>8}{:>12}{:>12}{:>12}'.format(
+            name, stats['packets_sent'], stats['packets_received'], stats['settings_writes'], stats['jobs_alive'],
+            stats['memory_kb'], stats['hooks_ms'], stats['jobs_ms']))
+    lines.append('Bot replies: {}'.format(result['replies_sent']))
+    return '\n'.join(lines)
+
+
+class Link(object):
+    """Loopback between two harnesses: friend 0 of each one is the other."""
+
+    def __init__(self, first, second):
+        self.sides = ((first, second), (second, first))
+        self.packets = 0
+
+    def deliver(self):
+        while any(side.tox.sent for side, _ in self.sides):
+            for side, other in self.sides:
+                sent, side.tox.sent = side.tox.sent, []
+                for friend_number, packet in sent:
+                    name, data = harness.decode_packet(packet)
+                    self.packets += 1
+                    if friend_number == 0 and name in other.plugins:
+                        other.plugins[name].lossless_packet(data, 0)
+
+
+def chess_match(plies, seed=0):
+    """Plays random moves between two Chess plugins.
+
+    :return: A tuple (number of plies played, number of packets, True if
+        both boards ended in the same position).
+    """
+    rng = random.Random(seed)
+    clock = Clock(0.1)
+    first, second = harness.Harness(1, seed), harness.Harness(1, seed + 1)
+    white, black = first.load(*PLUGINS['chess']), second.load(*PLUGINS['chess'])
+    chess = sys.modules['chess']
+    link = Link(first, second)
+    for plugin, is_white in ((white, True), (black, False)):
+        plugin.board = chess.Board(plugin)
+        plugin.game, plugin.white, plugin.pre, plugin.is_my_move = 0, is_white, None, is_white
+    played = 0
+    for ply in range(plies):
+        side = white if ply % 2 == 0 else black
+        moves = sorted(side.board.position.get_legal_moves(), key=str)
+        if not moves:
+            break
+        move = rng.choice(moves)
+        side.board.make_move(move)
+        side.move(move)
+        played += 1
+        # a few ticks, so resending runs too
+        for _ in range(rng.randint(1, 15)):
+            clock.tick()
+            link.deliver()
+    return played, link.packets, white.board.position.fen == black.board.position.fen
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plugin load simulator')
+    commands = parser.add_subparsers(dest='command')
+    friends = commands.add_parser('friends', help='simulate many virtual friends')
+    friends.add_argument('--friends', type=int, default=1000)
+    friends.add_argument('--seconds', type=float, default=60.0, help='simulated time')
+    friends.add_argument('--plugins', default='toxid,bday,bot,aans', help='comma separated short names')
+    friends.add_argument('--storm', action='store_true', help='connect all friends at start')
+    friends.add_argument('--connects', type=float, default=20.0, help='connections per second')
+    friends.add_argument('--disconnects', type=float, default=10.0, help='disconnections per second')
+    friends.add_argument('--messages', type=float, default=5.0, help='messages per second')
+    friends.add_argument('--seed', type=int, default=0)
+    friends.add_argument('--json', default=None, help='write report as JSON to this path')
+    match = commands.add_parser('chess', help='play a game between two Chess plugins')
+    match.add_argument('--plies', type=int, default=60)
+    match.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'friends':
+        simulator = Simulator(args.friends, args.plugins.split(','), seed=args.seed)
+        simulator.run(args.seconds, args.connects, args.disconnects, args.messages, args.storm)
+        result = simulator.report()
+        print(format_report(result))
+        closing = shutdown.close_plugins(simulator.plugins)
+        result['shutdown'] = closing.to_dict()
+        print(closing.format())
+        if args.json is not None:
+            with open(args.json, 'w') as fl:
+                json.dump(result, fl, indent=2, sort_keys=True)
+        if not exchanged(result):
+            sys.stderr.write('Nothing was exchanged, check rates of events\n')
+            sys.exit(1)
+    elif args.command == 'chess':
+        played, packets, synced = chess_match(args.plies, args.seed)
+        print('{} plies, {} packets, boards {}'.format(played, packets, 'in sync' if synced else 'DIFFER'))
+        if not synced:
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Microbenchmarks of plugin callbacks, run headless with the harness.
+
+    plugin_bench.py [--friends N] [--filter TEXT] [--json PATH]
+                    [--baseline PATH [--tolerance T]] [--save PATH]
+                    [--min-time SECONDS]
+
+Every benchmark reports the best time per call over several repeats,
+each repeat runs at least --min-time seconds. With --baseline the
+results are compared with a file written earlier by --save, and the exit
+code is 1 if any benchmark got slower by more than the tolerance (0.25
+means 25 %). Slowdowns below 1 us are timer noise and never count as
+regressions, so sub-microsecond benchmarks are only reported.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import harness
+
+# Ruy Lopez, closed variation
+GAME = ('e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8 h2h3 c6a5 b3c2 c7c5 '
+        'd2d4 d8c7 b1d2 c5d4 c3d4 a5c6 d2b3 a6a5 c1e3 a5a4').split()
+
+
+# smallest slowdown per call reported as a regression, in seconds
+MIN_DIFF = 1e-6
+
+
+def calibrate(fn, min_time):
+    """:return: Number of calls taking at least `min_time` seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            return number
+        number *= 2
+
+
+def measure(fn, number, repeat):
+    """:return: The best time of one call in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_aans(h, friends):
+    plugin = h.load('AutoAnswer', 'aans', 'AutoAnswer',
+                    settings={'friends': {friend.tox_id[:64]: {} for friend in h.friends[::2]}, 'max_calls': 0})
+    plugin.start()
+    allowed, other = friends[0], friends[1]
+
+    def call(number):
+        def fn():
+            h.profile.incoming_call(True, False, number)
+            del h.profile.log[:]
+        return fn
+
+    yield 'aans.incoming_call.allowed', call(allowed.number)
+    yield 'aans.incoming_call.other', call(other.number)
+    plugin.stop()
+
+
+def bench_toxid(h, friends):
+    plugin = h.load('CopyableToxId', 'toxid', 'CopyableToxId',
+                    settings={'send_id': True, 'ids': {f.tox_id[:64]: h.tox.friend_address(f.number)[64:]
+                                                      for f in friends}})
+    known = h.tox.friend_address(friends[-1].number)
+
+    def packet(data, number):
+        def fn():
+            plugin.lossless_packet(data, number)
+            del h.tox.sent[:]
+        return fn
+
+    yield 'toxid.lossless_packet.known', packet(known, friends[-1].number)
+    yield 'toxid.lossless_packet.request', packet('', friends[-1].number)
+    plugin.close()
+
+
+def bench_chess(h, friends):
+    plugin = h.load('Chess', 'chess', 'Chess')
+    chess = sys.modules['chess']
+    moves = [chess.Move.from_uci(uci) for uci in GAME]
+
+    def game():
+        """Replays GAME as black, only opponent's moves are timed."""
+        plugin.board = chess.Board(plugin)
+        plugin.game, plugin.white, plugin.pre, plugin.is_my_move = 0, False, None, False
+        elapsed = 0.0
+        for ply, uci in enumerate(GAME):
+            if ply % 2 == 0:
+                start = time.perf_counter()
+                plugin.lossless_packet(uci, 0)
+                elapsed += time.perf_counter() - start
+            else:
+                plugin.board.make_move(moves[ply])
+                plugin.move(moves[ply])
+        del h.tox.sent[:]
+        return elapsed / (len(GAME) // 2)
+
+    yield 'chess.lossless_packet.move', game
+    plugin.stop_game()
+
+
+def bench_hooks(h, friends):
+    from plugin_utils import hooks
+
+    class Target(object):
+        def method(self, a, b, c):
+            pass
+
+    target = Target()
+    yield 'hooks.direct_call', lambda: target.method(1, 2, 3)
+    hooks.add(target, 'method', 'first', lambda a, b, c: False)
+    yield 'hooks.dispatch.1_handler', lambda: target.method(1, 2, 3)
+    for i in range(4):
+        hooks.add(target, 'method', i, lambda a, b, c: False)
+    yield 'hooks.dispatch.5_handlers', lambda: target.method(1, 2, 3)
+    hooks.add(target, 'method', 'first', lambda a, b, c: True, first=True)
+    yield 'hooks.dispatch.short_circuit', lambda: target.method(1, 2, 3)
+    for key in ['first'] + list(range(4)):
+        hooks.remove(target, 'method', key)
+
+
+BENCHMARKS = (bench_hooks, bench_aans, bench_toxid, bench_chess)
+
+
+def run(friends, pattern, min_time=0.05):
+    h = harness.Harness(friends)
+    results = {}
+    for bench in BENCHMARKS:
+        for name, fn in bench(h, h.friends):
+            if pattern and pattern not in name:
+                continue
+            if name.startswith('chess.'):
+                # fn() times itself, a game is too long to be called thousands of times
+                results[name] = min(fn() for _ in range(5))
+            else:
+                results[name] = measure(fn, calibrate(fn, min_time), 7)
+            print('{:<36}{:>12.2f} us'.format(name, results[name] * 1000000))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """:return: A list of (name, baseline, result) of regressed benchmarks."""
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        if name in baseline and seconds > baseline[name] * (1 + tolerance) and seconds - baseline[name] > MIN_DIFF:
+            regressions.append((name, baseline[name], seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plugin callback benchmarks')
+    parser.add_argument('--friends', type=int, default=100, help='number of fake friends')
+    parser.add_argument('--filter', default=None, help='run only benchmarks containing this text')
+    parser.add_argument('--json', default=None, help='write results as JSON to this path')
+    parser.add_argument('--save', default=None, help='write results as a baseline to this path')
+    parser.add_argument('--baseline', default=None, help='compare results with this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 means 25 %%')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimal duration of one repeat in seconds')
+    args = parser.parse_args()
+
+    results = run(args.friends, args.filter, args.min_time)
+    for path in (args.json, args.save):
+        if path is not None:
+            with open(path, 'w') as fl:
+                json.dump(results, fl, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as fl:
+            baseline = json.load(fl)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print('Regression: {} {:.2f} us -> {:.2f} us ({:+.0f} %)'.format(
+                name, before * 1000000, after * 1000000, (after / before - 1) * 100))
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
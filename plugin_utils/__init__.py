@@ -0,0 +1,5 @@
+"""Helpers shared by the plugins in this repository.
+
+Copy this package into the Toxygen plugins folder next to the plugins
+which use it.
+"""
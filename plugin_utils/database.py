@@ -0,0 +1,173 @@
+import plugin_super_class
+import contextlib
+import json
+import re
+import sqlite3
+
+
+class Namespace:
+    """
+    Key-value table of one plugin. Keys are strings, values are anything json can serialize.
+    Keys are the primary key of the table, so lookups by key (e.g. by public key) and by key prefix use an index.
+    """
+
+    def __init__(self, database, table):
+        self._database = database
+        self._table = table
+        self.writes = 0
+        self._execute('CREATE TABLE IF NOT EXISTS "{}" (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+
+    def _execute(self, query, args=()):
+        return self._database.execute(query.format(self._table), args)
+
+    def __getitem__(self, key):
+        row = self._execute('SELECT value FROM "{}" WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        self._execute('INSERT OR REPLACE INTO "{}" (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def __delitem__(self, key):
+        self.writes += 1
+        self._execute('DELETE FROM "{}" WHERE key = ?', (key,))
+
+    def __contains__(self, key):
+        return self._execute('SELECT 1 FROM "{}" WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM "{}"').fetchone()[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [row[0] for row in self._execute('SELECT key FROM "{}" ORDER BY key')]
+
+    def items(self):
+        return [(row[0], json.loads(row[1])) for row in self._execute('SELECT key, value FROM "{}" ORDER BY key')]
+
+    def find_prefix(self, prefix):
+        """
+        :return list of (key, value) for keys starting with prefix
+        """
+        rows = self._execute('SELECT key, value FROM "{}" WHERE key >= ? AND key < ? ORDER BY key',
+                             (prefix, prefix + '\uffff'))
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def update(self, data):
+        """
+        Stores all items of dict in one transaction
+        """
+        self.writes += 1
+        with self._database.transaction():
+            self._database.executemany('INSERT OR REPLACE INTO "{}" (key, value) VALUES (?, ?)'.format(self._table),
+                                       [(key, json.dumps(value)) for key, value in data.items()])
+
+    def batch(self):
+        """
+        Context manager, all changes inside it are committed in one transaction
+        """
+        return self._database.transaction()
+
+
+class PluginDatabase:
+    """
+    SQLite database shared by plugins. Each namespace is a separate table.
+    Changes outside of transaction() are committed immediately.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._depth = 0
+
+    def execute(self, query, args=()):
+        return self._connection.execute(query, args)
+
+    def executemany(self, query, args):
+        return self._connection.executemany(query, args)
+
+    def namespace(self, name):
+        """
+        :param name: namespace name, usually plugin's short name
+        """
+        return Namespace(self, 'ns_' + re.sub(r'\W', '_', name))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager for batched changes. Nested transactions are merged into the outer one
+        """
+        if self._depth == 0:
+            self._connection.execute('BEGIN')
+        self._depth += 1
+        try:
+            yield
+        except:
+            self._depth -= 1
+            if self._depth == 0:
+                self._connection.execute('ROLLBACK')
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self._connection.execute('COMMIT')
+
+    def close(self):
+        self._connection.close()
+
+
+_database = None
+
+
+def get_database():
+    """
+    :return shared database stored in plugins folder
+    """
+    global _database
+    if _database is None:
+        _database = PluginDatabase(plugin_super_class.path_to_data('') + 'plugins.db')
+    return _database
+
+
+def migrate_json(database, name, data, id_lists=(), id_dicts=()):
+    """
+    Copies plugin's json settings to namespace name in one transaction.
+    Lists of Tox IDs named in id_lists and dicts keyed by public key or Tox ID named in id_dicts are moved
+    to separate namespaces name + '_' + key, keyed by public key, so a change of one friend's data is one row.
+    """
+    with database.transaction():
+        settings = database.namespace(name)
+        for key, value in data.items():
+            if key in id_lists:
+                database.namespace(name + '_' + key).update({tox_id[:64]: tox_id for tox_id in value})
+            elif key in id_dicts:
+                database.namespace(name + '_' + key).update({tox_id[:64]: item for tox_id, item in value.items()})
+            else:
+                settings[key] = value
+        settings['_migrated'] = True
+
+
+def open_namespace(plugin, id_lists=(), id_dicts=(), convert=None):
+    """
+    Opens namespace for plugin. On first call settings are migrated from plugin's settings.json
+    :param plugin: plugin instance
+    :param id_lists: see migrate_json
+    :param id_dicts: see migrate_json
+    :param convert: function converting old formats of settings dict before migration
+    :return Namespace of plugin's settings
+    """
+    database = get_database()
+    name = plugin.get_short_name()
+    settings = database.namespace(name)
+    if '_migrated' not in settings:
+        data = json.loads(plugin.load_settings())
+        if convert is not None:
+            data = convert(data)
+        migrate_json(database, name, data, id_lists, id_dicts)
+    return settings
@@ -0,0 +1,165 @@
+import base64
+import collections
+import itertools
+import time
+from plugin_utils import outbox
+
+VERSION = 1
+MARKER = '\x1e'  # ASCII record separator, never starts legacy packets
+
+# Frame: MARKER version:type:request id:chunk index:chunks count:encoding:payload
+# Host decodes packets byte by byte, so payload is sent as is only if it's ASCII, otherwise as base64 of utf-8
+# Plugin id is not a part of the frame - packets are already routed to plugins by short name
+
+
+class Message:
+    """
+    Received message. Unframed packets are returned as legacy messages with type None
+    """
+
+    def __init__(self, msg_type, payload, friend_number, request_id=None, version=None):
+        self.type = msg_type
+        self.payload = payload
+        self.friend_number = friend_number
+        self.request_id = request_id
+        self.version = version
+
+    @property
+    def legacy(self):
+        return self.version is None
+
+
+def _encode(payload):
+    try:
+        payload.encode('ascii')
+        return 'a', payload
+    except UnicodeEncodeError:
+        return 'b', base64.b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def _decode(encoding, payload):
+    if encoding == 'b':
+        return base64.b64decode(payload.encode('ascii')).decode('utf-8')
+    return payload
+
+
+def make_frames(msg_type, payload, request_id, chunk_size):
+    """
+    :return list of frames for message
+    """
+    encoding, payload = _encode(payload)
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)] or ['']
+    return ['{}{}:{}:{}:{}:{}:{}:{}'.format(MARKER, VERSION, msg_type, request_id, index, len(chunks), encoding, chunk)
+            for index, chunk in enumerate(chunks)]
+
+
+def parse_frame(data):
+    """
+    :return tuple (version, type, request id, chunk index, chunks count, encoding, chunk) or None if data is not a frame
+    """
+    if not data.startswith(MARKER):
+        return None
+    parts = data[1:].split(':', 6)
+    if len(parts) != 7:
+        return None
+    try:
+        version, request_id, index, count = int(parts[0]), int(parts[2]), int(parts[3]), int(parts[4])
+    except ValueError:
+        return None
+    if not 0 <= index < count:
+        return None
+    return version, parts[1], request_id, index, count, parts[5], parts[6]
+
+
+class Protocol:
+    """
+    Framed messages of one plugin. Large payloads are split into chunks and reassembled on receiving side.
+    Reassembly buffers are bounded by number of pending messages, message size and age.
+    """
+
+    def __init__(self, plugin, chunk_size=1000, max_pending=16, max_chunks=256, timeout=60.0, clock=time.monotonic):
+        """
+        :param plugin: plugin instance
+        :param chunk_size: max payload length of one frame
+        :param max_pending: max number of partially received messages, oldest ones are dropped
+        :param max_chunks: messages with more chunks are dropped
+        :param timeout: partially received messages older than this number of seconds are dropped
+        """
+        self._plugin = plugin
+        self._chunk_size = chunk_size
+        self._max_pending = max_pending
+        self._max_chunks = max_chunks
+        self._timeout = timeout
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self._pending = collections.OrderedDict()  # (friend number, request id, type) -> [time, chunks, missing count]
+        self.dropped = 0
+
+    def send(self, msg_type, payload, friend_number, request_id=None, priority=outbox.NORMAL):
+        """
+        Sends message through outbox
+        :param msg_type: message type, must not contain ':'
+        :param payload: str
+        :param request_id: id of request this message answers, new id is used if None
+        :return request id
+        """
+        if request_id is None:
+            request_id = next(self._ids)
+        for frame in make_frames(msg_type, payload, request_id, self._chunk_size):
+            outbox.send(self._plugin, frame, friend_number, priority)
+        return request_id
+
+    def receive(self, data, friend_number):
+        """
+        Should be called from plugin's lossless_packet
+        :return Message, or None if message is incomplete or frame is invalid
+        """
+        frame = parse_frame(data)
+        if frame is None:
+            if data.startswith(MARKER):
+                # damaged frame, it's not a legacy packet
+                self.dropped += 1
+                return None
+            return Message(None, data, friend_number)
+        version, msg_type, request_id, index, count, encoding, chunk = frame
+        if count > self._max_chunks:
+            self.dropped += 1
+            return None
+        if count > 1:
+            chunk = self._reassemble(friend_number, msg_type, request_id, index, count, chunk)
+            if chunk is None:
+                return None
+        try:
+            payload = _decode(encoding, chunk)
+        except ValueError:
+            self.dropped += 1
+            return None
+        return Message(msg_type, payload, friend_number, request_id, version)
+
+    def _reassemble(self, friend_number, msg_type, request_id, index, count, chunk):
+        now = self._clock()
+        while self._pending and now - next(iter(self._pending.values()))[0] >= self._timeout:
+            self._pending.popitem(False)
+            self.dropped += 1
+        key = (friend_number, request_id, msg_type)
+        if key not in self._pending:
+            if len(self._pending) >= self._max_pending:
+                self._pending.popitem(False)
+                self.dropped += 1
+            self._pending[key] = [now, [None] * count, count]
+        entry = self._pending[key]
+        chunks = entry[1]
+        if len(chunks) != count:
+            del self._pending[key]
+            self.dropped += 1
+            return None
+        if chunks[index] is None:
+            entry[2] -= 1
+        chunks[index] = chunk
+        if entry[2]:
+            return None
+        del self._pending[key]
+        return ''.join(chunks)
+
+    def pending_count(self):
+        return len(self._pending)
@@ -0,0 +1,97 @@
+import collections
+
+
+class Hook:
+    """
+    Extension point with ordered handlers. Handlers are called with hook's arguments, a handler returning True
+    stops dispatch. If no handler did, the original function is called.
+    Adding and removing handlers is O(1), dispatch iterates over a tuple rebuilt on change.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self._handlers = collections.OrderedDict()
+        self._chain = ()
+
+    def add(self, key, handler, first=False):
+        """
+        :param key: unique key of handler, usually plugin's short name. Handler with the same key is replaced
+        :param handler: callable
+        :param first: if True, handler is called before already added ones
+        """
+        self._handlers[key] = handler
+        if first:
+            self._handlers.move_to_end(key, last=False)
+        self._chain = tuple(self._handlers.values())
+
+    def remove(self, key):
+        self._handlers.pop(key, None)
+        self._chain = tuple(self._handlers.values())
+
+    def __len__(self):
+        return len(self._handlers)
+
+    def __call__(self, *args):
+        for handler in self._chain:
+            if handler(*args):
+                return None
+        if self.original is not None:
+            return self.original(*args)
+
+
+_hooks = {}  # (id(obj), name) -> (obj, Hook, own instance attribute)
+
+
+def add(obj, name, key, handler, first=False):
+    """
+    Adds handler to method of obj, e.g. add(profile, 'incoming_call', 'aans', handler).
+    Method is replaced with Hook once, so plugins can add and remove handlers in any order
+    """
+    entry = _hooks.get((id(obj), name))
+    if entry is None:
+        entry = (obj, Hook(getattr(obj, name)), name in getattr(obj, '__dict__', {}))
+        _hooks[(id(obj), name)] = entry
+        setattr(obj, name, entry[1])
+    entry[1].add(key, handler, first)
+
+
+def remove(obj, name, key):
+    """
+    Removes handler. Original method is restored when hook has no handlers left
+    """
+    entry = _hooks.get((id(obj), name))
+    if entry is None:
+        return
+    obj, hook, own = entry
+    hook.remove(key)
+    if not len(hook):
+        del _hooks[(id(obj), name)]
+        if own:
+            setattr(obj, name, hook.original)
+        else:
+            delattr(obj, name)
+
+
+def add_callback(tox, event, key, handler, first=False):
+    """
+    Adds handler to tox callback, e.g. add_callback(tox, 'friend_message', 'bot', handler).
+    Hook is registered with tox.callback_<event> and calls previously registered tox.<event>_cb as original
+    """
+    entry = _hooks.get((id(tox), event))
+    if entry is None:
+        hook = Hook(getattr(tox, event + '_cb', None))
+        entry = (tox, hook, None)
+        _hooks[(id(tox), event)] = entry
+        getattr(tox, 'callback_' + event)(hook, None)
+    entry[1].add(key, handler, first)
+
+
+def remove_callback(tox, event, key):
+    entry = _hooks.get((id(tox), event))
+    if entry is None:
+        return
+    hook = entry[1]
+    hook.remove(key)
+    if not len(hook):
+        del _hooks[(id(tox), event)]
+        getattr(tox, 'callback_' + event)(hook.original, None)
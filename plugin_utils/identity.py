@@ -0,0 +1,100 @@
+from plugin_utils import hooks
+
+
+class FriendIndex:
+    """
+    Cached mapping between friend numbers, public keys and Tox IDs shared by plugins.
+    Entries are filled on first lookup and trusted until friend is added or removed. Friend numbers are reused
+    after removal, so tox.friend_add(), friend_add_norequest() and friend_delete() are hooked to invalidate them.
+    """
+
+    def __init__(self, tox, profile):
+        self._tox = tox
+        self._profile = profile
+        self._by_number = {}  # friend number -> (public key, tox id)
+        self._by_key = {}  # public key -> friend number
+        for name in ('friend_add', 'friend_add_norequest'):
+            hooks.add(tox, name, 'identity', self._adding)
+        hooks.add(tox, 'friend_delete', 'identity', self._deleting)
+
+    def _add(self, number):
+        self.friend_removed(number)
+        try:
+            public_key = self._tox.friend_get_public_key(number)
+        except Exception:  # no such friend
+            return None
+        friend = self._profile.get_friend_by_number(number)
+        tox_id = friend.tox_id if friend is not None else public_key
+        self._by_number[number] = (public_key, tox_id)
+        self._by_key[public_key] = number
+        return self._by_number[number]
+
+    def _entry(self, number):
+        entry = self._by_number.get(number)
+        return entry if entry is not None else self._add(number)
+
+    def _adding(self, key, *args):
+        # friend number isn't known before tox returns it, cached entry of this key is dropped instead
+        number = self._by_key.get(key[:64])
+        if number is not None:
+            self.friend_removed(number)
+
+    def _deleting(self, number):
+        self.friend_removed(number)
+
+    def public_key(self, number):
+        """
+        :return public key of friend or None
+        """
+        entry = self._entry(number)
+        return entry[0] if entry is not None else None
+
+    def tox_id(self, number):
+        """
+        :return friend's tox_id as known by profile or None
+        """
+        entry = self._entry(number)
+        return entry[1] if entry is not None else None
+
+    def number(self, key):
+        """
+        :param key: public key or Tox ID
+        :return friend number or None
+        """
+        key = key[:64]
+        number = self._by_key.get(key)
+        if number is not None:
+            return number
+        try:
+            number = self._tox.friend_by_public_key(key)
+        except Exception:  # not a friend
+            return None
+        self._add(number)
+        return number
+
+    def friend_added(self, number):
+        """
+        Updates entry of friend number, e.g. after friend was added without the hooked tox methods
+        """
+        self._add(number)
+
+    def friend_removed(self, number):
+        entry = self._by_number.pop(number, None)
+        if entry is not None and self._by_key.get(entry[0]) == number:
+            del self._by_key[entry[0]]
+
+    def friend_connected(self, number):
+        self._entry(number)
+
+
+_indexes = {}
+
+
+def get_index(tox, profile):
+    """
+    :return FriendIndex shared by all plugins using the same tox instance
+    """
+    key = id(tox)
+    if key not in _indexes:
+        _indexes[key] = FriendIndex(tox, profile)
+    return _indexes[key]
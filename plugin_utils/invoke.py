@@ -0,0 +1,96 @@
+from PyQt5 import QtCore
+import collections
+import itertools
+import threading
+import time
+import traceback
+
+
+class InvokeEvent(QtCore.QEvent):
+    EVENT_TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
+
+    def __init__(self):
+        QtCore.QEvent.__init__(self, InvokeEvent.EVENT_TYPE)
+
+
+class Dispatcher(QtCore.QObject):
+    """
+    Runs callables posted from any thread in the main thread.
+    All calls queued between two iterations of the Qt event loop are executed by a single event.
+    Calls posted with the same key are coalesced, only the latest one is executed.
+    If monitor is set, its record() gets queue wait and execution time of every call.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._queue = collections.OrderedDict()
+        self._counter = itertools.count()
+        self._posted = False
+        self.monitor = None
+
+    def invoke(self, fn, *args, **kwargs):
+        self._put(next(self._counter), fn, args, kwargs)
+
+    def invoke_coalesced(self, key, fn, *args, **kwargs):
+        self._put(('key', key), fn, args, kwargs)
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._queue)
+
+    def _put(self, key, fn, args, kwargs):
+        with self._lock:
+            # a coalesced call is moved to the end, so it runs after everything posted before it
+            # but keeps time of the first post, so its wait time is not hidden by coalescing
+            old = self._queue.pop(key, None)
+            self._queue[key] = (fn, args, kwargs, old[3] if old is not None else time.perf_counter())
+            if self._posted:
+                return
+            self._posted = True
+        QtCore.QCoreApplication.postEvent(self, InvokeEvent())
+
+    def event(self, event):
+        if event.type() != InvokeEvent.EVENT_TYPE:
+            return super().event(event)
+        with self._lock:
+            queue, self._queue = self._queue, collections.OrderedDict()
+            self._posted = False
+        monitor = self.monitor
+        for fn, args, kwargs, posted in queue.values():
+            start = time.perf_counter()
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            if monitor is not None:
+                monitor.record(fn, start - posted, time.perf_counter() - start)
+        return True
+
+
+_dispatcher = Dispatcher()
+
+
+def invoke_in_main_thread(fn, *args, **kwargs):
+    _dispatcher.invoke(fn, *args, **kwargs)
+
+
+def invoke_coalesced(key, fn, *args, **kwargs):
+    """
+    Like invoke_in_main_thread, but only the latest pending call with this key is executed
+    """
+    _dispatcher.invoke_coalesced(key, fn, *args, **kwargs)
+
+
+def set_monitor(monitor):
+    """
+    :param monitor: object with record(fn, wait, duration) method or None
+    """
+    _dispatcher.monitor = monitor
+
+
+def queue_depth():
+    """
+    :return number of calls waiting for the main thread
+    """
+    return _dispatcher.queue_depth()
@@ -0,0 +1,114 @@
+from PyQt5 import QtCore
+import collections
+import sys
+import time
+from plugin_utils import invoke
+from plugin_utils.profiler import Histogram
+
+
+def callable_name(fn):
+    """
+    :return name of callable including its module, e.g. 'bot.Bot.answer'
+    """
+    fn = getattr(fn, 'func', fn)  # functools.partial
+    return '{}.{}'.format(getattr(fn, '__module__', None) or '?',
+                          getattr(fn, '__qualname__', None) or type(fn).__name__)
+
+
+class LagMonitor:
+    """
+    Measures how long callables posted to main thread wait in queue and run, and how late heartbeat timer fires.
+    Every heartbeat also samples number of callables waiting for main thread.
+    Calls and heartbeats exceeding threshold are printed to stderr and kept in warnings.
+    """
+
+    def __init__(self, threshold=0.1, heartbeat=0.1, clock=time.perf_counter, keep=100):
+        """
+        :param threshold: seconds of wait, execution or loop lag which produce warning
+        :param heartbeat: heartbeat timer interval in seconds
+        :param keep: max number of kept warnings
+        """
+        self.threshold = threshold
+        self._interval = heartbeat
+        self._clock = clock
+        self._timer = None
+        self._last_beat = None
+        self.wait = {}  # callable name -> Histogram
+        self.run = {}
+        self.loop_lag = Histogram()
+        self.queue_depth = 0  # at last heartbeat
+        self.max_queue_depth = 0
+        self.warnings = collections.deque(maxlen=keep)
+
+    def start(self):
+        """
+        Starts heartbeat timer and measuring of posted callables
+        """
+        if self._timer is None:
+            self._timer = QtCore.QTimer()
+            self._timer.timeout.connect(self.beat)
+        self._last_beat = self._clock()
+        self._timer.start(int(self._interval * 1000))
+        invoke.set_monitor(self)
+
+    def stop(self):
+        invoke.set_monitor(None)
+        if self._timer is not None:
+            self._timer.stop()
+
+    def reset(self):
+        self.wait.clear()
+        self.run.clear()
+        self.loop_lag = Histogram()
+        self.queue_depth = self.max_queue_depth = 0
+        self.warnings.clear()
+
+    def record(self, fn, wait, duration):
+        name = callable_name(fn)
+        if name not in self.wait:
+            self.wait[name] = Histogram()
+            self.run[name] = Histogram()
+        self.wait[name].add(wait)
+        self.run[name].add(duration)
+        if duration > self.threshold:
+            self.warn(name, 'run', duration)
+        elif wait > self.threshold:
+            self.warn(name, 'wait', wait)
+
+    def beat(self):
+        now = self._clock()
+        lag = max(0.0, now - self._last_beat - self._interval)
+        self._last_beat = now
+        self.loop_lag.add(lag)
+        self.queue_depth = invoke.queue_depth()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        if lag > self.threshold:
+            self.warn('event loop', 'lag', lag)
+
+    def warn(self, name, kind, seconds):
+        self.warnings.append((time.time(), name, kind, seconds))
+        sys.stderr.write('Main thread {} {:.0f} ms: {}\n'.format(kind, seconds * 1000, name))
+
+    def to_dict(self):
+        return {
+            'loop_lag': self.loop_lag.to_dict(),
+            'queue_depth': {'last': self.queue_depth, 'max': self.max_queue_depth},
+            'calls': {name: {'wait': self.wait[name].to_dict(), 'run': self.run[name].to_dict()}
+                      for name in sorted(self.wait)},
+            'warnings': [{'time': t, 'name': name, 'kind': kind, 'ms': round(seconds * 1000, 3)}
+                         for t, name, kind, seconds in self.warnings]
+        }
+
+    def summary(self):
+        lines = ['Event loop lag: p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+            self.loop_lag.percentile(0.5) * 1000, self.loop_lag.percentile(0.99) * 1000, self.loop_lag.max * 1000),
+            'Queued calls: {}, max {}'.format(self.queue_depth, self.max_queue_depth)]
+        for name in sorted(self.run, key=lambda n: -self.run[n].total):
+            wait, run = self.wait[name], self.run[name]
+            lines.append('{}: {} calls, wait p99 {:.1f} ms, run p99 {:.1f} ms, run max {:.1f} ms'.format(
+                name, run.count, wait.percentile(0.99) * 1000, run.percentile(0.99) * 1000, run.max * 1000))
+        lines.append('Warnings: {}'.format(len(self.warnings)))
+        return '\n'.join(lines)
+
+
+monitor = LagMonitor()
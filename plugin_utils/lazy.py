@@ -0,0 +1,127 @@
+import functools
+import time
+
+
+class StartupReport:
+    """
+    Times of plugins' startup: module import, construction, start() and deferred initialization on first use
+    (settings loading, translators etc.). Stage with time None wasn't measured
+    """
+
+    STAGES = ('import', 'construct', 'start')
+
+    def __init__(self):
+        self._times = {}
+
+    def add(self, name, stage, seconds):
+        self._times.setdefault(name, {})[stage] = seconds
+
+    def to_dict(self):
+        return {name: dict(stages) for name, stages in self._times.items()}
+
+    def plugin_total(self, name):
+        return sum(seconds for seconds in self._times[name].values() if seconds is not None)
+
+    def total(self):
+        return sum(self.plugin_total(name) for name in self._times)
+
+    def format(self):
+        lines = []
+        for name in sorted(self._times, key=lambda n: -self.plugin_total(n)):
+            stages = self._times[name]
+            order = list(self.STAGES) + sorted(stage for stage in stages if stage not in self.STAGES)
+            lines.append('{}: {}'.format(name, ', '.join(
+                '{} not measured'.format(stage) if stages.get(stage) is None else
+                '{} {:.1f} ms'.format(stage, stages[stage] * 1000) for stage in order)))
+        lines.append('Total: {:.1f} ms'.format(self.total() * 1000))
+        return '\n'.join(lines)
+
+
+report = StartupReport()
+
+_imports = {}  # module name -> time when its import started
+
+
+def _timed(name, stage, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        report.add(name, stage, time.perf_counter() - start)
+
+
+class attribute:
+    """
+    Plugin attribute created on first access instead of in __init__, e.g. _data = lazy.attribute(SettingsStore).
+    Time of creation is added to report
+    """
+
+    def __init__(self, factory):
+        """
+        :param factory: function called with plugin instance
+        """
+        self._factory = factory
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, plugin, owner):
+        if plugin is None:
+            return self
+        value = _timed(plugin.get_name(), self._name.lstrip('_'), self._factory, plugin)
+        plugin.__dict__[self._name] = value
+        return value
+
+
+def is_loaded(plugin, name):
+    """
+    :return True if lazy attribute was already created, e.g. close() saves settings only if they were loaded
+    """
+    return name in plugin.__dict__
+
+
+def translated(method):
+    """
+    Decorator for plugin methods showing translated texts. Plugin's translator is loaded before the first call
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.__dict__.get('_translator_loaded'):
+            self._translator_loaded = True
+            _timed(self.get_name(), 'translator', self.load_translator)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def importing(module_name):
+    """
+    Marks start of plugin module's import, it's called before module's other imports:
+    lazy.importing(__name__)
+    """
+    _imports[module_name] = time.perf_counter()
+
+
+def measure_startup(cls):
+    """
+    Class decorator of plugins. Adds time of plugin module's import (from importing() call to class definition),
+    of construction and of start() to report. Without importing() call import time is reported as not measured
+    """
+    started = _imports.pop(cls.__module__, None)
+    imported = time.perf_counter() - started if started is not None else None
+    init, start = cls.__init__, cls.start
+
+    @functools.wraps(init)
+    def __init__(self, *args, **kwargs):
+        begin = time.perf_counter()
+        init(self, *args, **kwargs)
+        report.add(self.get_name(), 'construct', time.perf_counter() - begin)
+        report.add(self.get_name(), 'import', imported)
+
+    @functools.wraps(start)
+    def start_wrapper(self):
+        return _timed(self.get_name(), 'start', start, self)
+
+    cls.__init__ = __init__
+    cls.start = start_wrapper
+    return cls
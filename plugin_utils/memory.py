@@ -0,0 +1,133 @@
+import gc
+import json
+import os
+import sys
+import tracemalloc
+import plugin_super_class
+
+
+def plugin_paths(plugins):
+    """
+    Plugins' modules usually share one folder, so a plugin owns its module file and its data folder
+    :param plugins: dict name -> plugin instance
+    :return tuple (dict file -> name, dict folder -> name). Shared plugin_utils package is reported as 'plugin_utils'
+    """
+    files = {}
+    folders = {os.path.dirname(os.path.realpath(__file__)) + os.sep: 'plugin_utils'}
+    for name, plugin in plugins.items():
+        module = sys.modules.get(type(plugin).__module__)
+        if getattr(module, '__file__', None):
+            files[os.path.realpath(module.__file__)] = name
+        if hasattr(plugin, '_short_name'):
+            folders[os.path.realpath(plugin_super_class.path_to_data(plugin._short_name)) + os.sep] = name
+    return files, folders
+
+
+class MemoryTracker:
+    """
+    Attributes memory allocated while tracing to plugins by the file of allocation's most recent frame.
+    Every snapshot is compared with the previous one to find growing allocation sites.
+    """
+
+    def __init__(self, frames=1):
+        self._frames = frames
+        self._previous = None
+        self._names = []
+        self._files = {}
+        self._folders = {}
+
+    def is_tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, plugins):
+        """
+        :param plugins: dict name -> plugin instance
+        """
+        self._files, self._folders = plugin_paths(plugins)
+        self._names = sorted(set(self._files.values()) | set(self._folders.values()))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+        self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def owner(self, filename):
+        filename = os.path.realpath(filename)
+        if filename in self._files:
+            return self._files[filename]
+        for folder, name in self._folders.items():
+            if filename.startswith(folder):
+                return name
+        return None
+
+    def per_plugin(self, snapshot):
+        """
+        :return dict name -> [bytes, blocks] of memory allocated by plugin's code
+        """
+        result = {name: [0, 0] for name in self._names}
+        for stat in snapshot.statistics('filename'):
+            name = self.owner(stat.traceback[0].filename)
+            if name is not None:
+                result[name][0] += stat.size
+                result[name][1] += stat.count
+        return result
+
+    def object_counts(self):
+        """
+        :return dict 'module.Class' -> number of live objects of classes defined in plugins' modules
+        """
+        modules = {module_name for module_name, module in list(sys.modules.items())
+                   if getattr(module, '__file__', None) and self.owner(module.__file__) is not None}
+        counts = {}
+        for obj in gc.get_objects():
+            cls = type(obj)
+            if cls.__module__ in modules:
+                key = cls.__module__ + '.' + cls.__qualname__
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def report(self, top=10):
+        """
+        Takes snapshot and compares it with the previous one
+        :return dict with per plugin usage, top growth sites since previous report and object counts
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                               tracemalloc.Filter(False, __file__)))
+        growth = []
+        if self._previous is not None:
+            for stat in snapshot.compare_to(self._previous, 'lineno'):
+                if stat.size_diff <= 0 or self.owner(stat.traceback[0].filename) is None:
+                    continue
+                frame = stat.traceback[0]
+                growth.append({'site': '{}:{}'.format(frame.filename, frame.lineno),
+                               'size_diff': stat.size_diff, 'count_diff': stat.count_diff, 'size': stat.size})
+                if len(growth) == top:
+                    break
+        self._previous = snapshot
+        return {
+            'plugins': {name: {'size': size, 'blocks': blocks}
+                        for name, (size, blocks) in self.per_plugin(snapshot).items()},
+            'growth': growth,
+            'objects': self.object_counts()
+        }
+
+    def to_json(self, top=10):
+        return json.dumps(self.report(top), indent=2, sort_keys=True)
+
+    def summary(self, top=10):
+        report = self.report(top)
+        lines = ['{}: {:.1f} KB in {} blocks'.format(name, stats['size'] / 1024, stats['blocks'])
+                 for name, stats in sorted(report['plugins'].items(), key=lambda item: -item[1]['size'])]
+        if report['growth']:
+            lines.append('Growth since previous report:')
+            lines.extend('{site}: {size_diff:+} B, {count_diff:+} blocks'.format(**item) for item in report['growth'])
+        objects = sorted(report['objects'].items(), key=lambda item: -item[1])[:top]
+        if objects:
+            lines.append('Objects:')
+            lines.extend('{}: {}'.format(name, count) for name, count in objects)
+        return '\n'.join(lines)
+
+
+tracker = MemoryTracker()
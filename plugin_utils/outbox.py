@@ -0,0 +1,105 @@
+import collections
+import traceback
+from plugin_utils import scheduler
+
+HIGH, NORMAL, LOW = range(3)
+
+
+class Outbox:
+    """
+    Queue of outgoing lossless packets shared by plugins.
+    Packets with the same (plugin, friend, key) are coalesced - only the latest one is sent, with the highest
+    priority any of them was queued with.
+    Every tick each friend gets at most budget packets, higher priority packets are sent first.
+    """
+
+    def __init__(self, budget=4, interval=0.05):
+        """
+        :param budget: max number of packets sent to one friend per tick
+        :param interval: seconds between ticks while queue is not empty
+        """
+        self._budget = budget
+        self._interval = interval
+        self._queues = [collections.OrderedDict() for _ in range(LOW + 1)]
+        self._job = None
+        self._counter = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    def send(self, plugin, data, friend_number, priority=NORMAL, key=None):
+        """
+        Queues packet
+        :param plugin: plugin instance, its send_lossless() is used
+        :param data: packet data
+        :param friend_number: friend number
+        :param priority: HIGH, NORMAL or LOW
+        :param key: packets with equal not None keys replace each other. Replaced packet keeps its place in queue,
+        if the new one has higher priority, it moves to the queue of that priority
+        """
+        if key is None:
+            self._counter += 1
+            key = ('', self._counter)
+        full_key = (plugin.get_short_name(), friend_number, key)
+        for index, queue in enumerate(self._queues):
+            if full_key in queue:
+                self.coalesced += 1
+                if index < priority:
+                    priority = index
+                elif index > priority:
+                    del queue[full_key]
+                break
+        self._queues[priority][full_key] = (plugin, data, friend_number)
+        if self._job is None:
+            self._job = scheduler.call_later(0, self.flush)
+
+    def cancel(self, plugin, friend_number, key):
+        """
+        Removes queued packet with given key if it was not sent yet
+        """
+        full_key = (plugin.get_short_name(), friend_number, key)
+        for queue in self._queues:
+            queue.pop(full_key, None)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues)
+
+    def flush(self):
+        """
+        Sends packets allowed by budget. Called by scheduler
+        """
+        self._job = None
+        spent = collections.Counter()
+        for queue in self._queues:
+            for full_key, (plugin, data, friend_number) in list(queue.items()):
+                if spent[friend_number] >= self._budget:
+                    continue
+                spent[friend_number] += 1
+                del queue[full_key]
+                try:
+                    plugin.send_lossless(data, friend_number)
+                    self.sent += 1
+                except Exception:
+                    traceback.print_exc()
+        if len(self):
+            self._job = scheduler.call_later(self._interval, self.flush)
+
+
+_outbox = None
+
+
+def get_outbox():
+    """
+    :return shared Outbox instance. Should be called from the main thread
+    """
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
+
+
+def send(plugin, data, friend_number, priority=NORMAL, key=None):
+    get_outbox().send(plugin, data, friend_number, priority, key)
+
+
+def cancel(plugin, friend_number, key):
+    get_outbox().cancel(plugin, friend_number, key)
@@ -0,0 +1,183 @@
+import json
+import os
+import time
+import traceback
+
+HOOKS = ('lossless_packet', 'friend_connected', 'get_menu', 'get_message_menu', 'command', 'start', 'stop', 'close')
+
+
+class Histogram:
+    """
+    Call counter with latency histogram. Bucket i counts calls shorter than 2 ** i microseconds
+    """
+
+    BUCKETS = 25
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * Histogram.BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1000000).bit_length(), Histogram.BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """
+        :return upper bound of bucket containing given fraction of calls in seconds
+        """
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << index) / 1000000, self.max)
+        return 0.0
+
+    def to_dict(self):
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            'count': self.count,
+            'total_ms': ms(self.total),
+            'mean_ms': ms(self.total / self.count) if self.count else 0.0,
+            'min_ms': ms(self.min or 0.0),
+            'max_ms': ms(self.max),
+            'p50_ms': ms(self.percentile(0.5)),
+            'p90_ms': ms(self.percentile(0.9)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'buckets_us': {str(1 << index): count for index, count in enumerate(self.buckets) if count}
+        }
+
+
+def host_plugins():
+    """
+    :return dict short name -> plugin instance of plugins loaded by Toxygen
+    """
+    try:
+        import plugin_support
+        return {name: value[0] for name, value in plugin_support.PluginLoader.get_instance()._plugins.items()}
+    except:
+        return {}
+
+
+class Profiler:
+    """
+    Measures plugins' hooks. Wrappers are set as instance attributes of plugins while profiler is enabled
+    and removed on disable, so disabled profiler costs nothing.
+    """
+
+    def __init__(self):
+        self._stats = {}  # (plugin name, hook) -> Histogram
+        self._patched = []  # (plugin, hook, own instance attribute or None)
+        self._export_job = None
+
+    def is_enabled(self):
+        return bool(self._patched)
+
+    def enable(self, plugins):
+        """
+        :param plugins: dict name -> plugin instance
+        """
+        self.disable()
+        for name, plugin in plugins.items():
+            for hook in HOOKS:
+                method = getattr(plugin, hook, None)
+                if method is not None:
+                    self._patched.append((plugin, hook, plugin.__dict__.get(hook)))
+                    setattr(plugin, hook, self._wrap(name, hook, method))
+
+    def disable(self):
+        for plugin, hook, own in reversed(self._patched):
+            if own is None:
+                del plugin.__dict__[hook]
+            else:
+                plugin.__dict__[hook] = own
+        self._patched = []
+
+    def _wrap(self, name, hook, method):
+        histogram = self._stats.setdefault((name, hook), Histogram())
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.add(time.perf_counter() - start)
+
+        return wrapper
+
+    def reset(self):
+        for histogram in self._stats.values():
+            histogram.__init__()
+
+    def to_dict(self):
+        result = {}
+        for (name, hook), histogram in sorted(self._stats.items()):
+            if histogram.count:
+                result.setdefault(name, {})[hook] = histogram.to_dict()
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def summary(self):
+        lines = []
+        items = [(key, histogram) for key, histogram in self._stats.items() if histogram.count]
+        for (name, hook), histogram in sorted(items, key=lambda item: -item[1].total):
+            lines.append('{} {}: {} calls, {:.1f} ms total, p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+                name, hook, histogram.count, histogram.total * 1000, histogram.percentile(0.5) * 1000,
+                histogram.percentile(0.99) * 1000, histogram.max * 1000))
+        return '\n'.join(lines) or 'No calls recorded'
+
+    def to_prometheus(self):
+        """
+        :return stats in Prometheus text exposition format
+        """
+        lines = ['# TYPE toxygen_plugin_hook_seconds histogram']
+        for (name, hook), histogram in sorted(self._stats.items()):
+            labels = 'plugin="{}",hook="{}"'.format(name, hook)
+            seen = 0
+            for index, count in enumerate(histogram.buckets[:-1]):
+                seen += count
+                lines.append('toxygen_plugin_hook_seconds_bucket{{{},le="{}"}} {}'.format(
+                    labels, (1 << index) / 1000000, seen))
+            lines.append('toxygen_plugin_hook_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, histogram.count))
+            lines.append('toxygen_plugin_hook_seconds_sum{{{}}} {}'.format(labels, histogram.total))
+            lines.append('toxygen_plugin_hook_seconds_count{{{}}} {}'.format(labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Atomically replaces file with current stats
+        """
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as fl:
+            fl.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def export_every(self, path, interval):
+        """
+        Writes Prometheus text file every interval seconds. None stops export
+        """
+        from plugin_utils import scheduler
+        if self._export_job is not None:
+            self._export_job.cancel()
+            self._export_job = None
+        if path is not None:
+            self._export_job = scheduler.call_every(interval, self._export, path)
+
+    def _export(self, path):
+        try:
+            self.write_prometheus(path)
+        except OSError:
+            traceback.print_exc()
+
+
+profiler = Profiler()
@@ -0,0 +1,173 @@
+from PyQt5 import QtCore
+import heapq
+import itertools
+import time
+import traceback
+
+
+class Job:
+    """
+    Periodic or one-shot job registered in Scheduler
+    """
+
+    def __init__(self, fn, args, interval):
+        self.fn = fn
+        self.args = args
+        self.interval = interval  # None for one-shot jobs
+        self.due = None
+        self.cancelled = False
+        self.running = False
+
+    def cancel(self):
+        """
+        Cancels job. It will not be called after this method returns
+        """
+        self.cancelled = True
+
+    @property
+    def active(self):
+        return not self.cancelled
+
+
+class Scheduler:
+    """
+    Runs jobs in the main thread using one single-shot QTimer, which is always armed for the nearest job.
+    Jobs are kept in a heap, cancelled jobs are dropped when they reach its top.
+    Timer is re-armed before every job, so jobs keep running while another job waits in a nested event loop
+    (e.g. QMessageBox.exec_()). A job is never called again while it is still running.
+    If monitor is set, its record() gets lateness and execution time of every job.
+    """
+
+    def __init__(self, clock=time.monotonic, use_timer=True):
+        """
+        :param clock: function returning current time in seconds
+        :param use_timer: if False, run_due() should be called by owner (useful with fake clock)
+        """
+        self._clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        self._timer = None
+        self.monitor = None
+        if use_timer:
+            self._timer = QtCore.QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self.run_due)
+
+    def call_later(self, delay, fn, *args):
+        """
+        Calls fn(*args) once after delay seconds
+        :return Job instance
+        """
+        job = Job(fn, args, None)
+        self._push(job, self._clock() + delay)
+        return job
+
+    def call_every(self, interval, fn, *args, delay=None):
+        """
+        Calls fn(*args) every interval seconds. First call happens after delay (default - interval) seconds
+        :return Job instance. Its interval attribute can be changed, new value is used for next calls
+        """
+        job = Job(fn, args, interval)
+        self._push(job, self._clock() + (interval if delay is None else delay))
+        return job
+
+    def jobs(self):
+        """
+        :return list of active jobs
+        """
+        return [entry[2] for entry in self._heap if not entry[2].cancelled]
+
+    def jobs_count(self):
+        return len(self.jobs())
+
+    def next_due(self):
+        """
+        :return time of the nearest job or None
+        """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self):
+        """
+        Runs all jobs which are due and re-arms timer. Can be re-entered from a nested event loop
+        """
+        now = self._clock()
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            _, _, job = heapq.heappop(self._heap)
+            if job.interval is not None:
+                # skip missed runs instead of calling job several times in a row
+                self._push(job, self._next_run(due, job.interval, now), False)
+            else:
+                job.cancelled = True
+            if job.running:
+                continue
+            self._arm()
+            job.running = True
+            start = time.perf_counter()
+            try:
+                job.fn(*job.args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                job.running = False
+            if self.monitor is not None:
+                self.monitor.record(job.fn, now - due, time.perf_counter() - start)
+        self._arm()
+
+    @staticmethod
+    def _next_run(due, interval, now):
+        """
+        :return first time after now in the due + k * interval series
+        """
+        if interval <= 0:
+            return now
+        return due + interval * (int((now - due) // interval) + 1)
+
+    def cancel_all(self):
+        """
+        Cancels all jobs, used on shutdown
+        """
+        for _, _, job in self._heap:
+            job.cancelled = True
+        self._heap = []
+        self._arm()
+
+    def _push(self, job, due, arm=True):
+        job.due = due
+        heapq.heappush(self._heap, (due, next(self._counter), job))
+        if arm:
+            self._arm()
+
+    def _arm(self):
+        if self._timer is None:
+            return
+        due = self.next_due()
+        if due is None:
+            self._timer.stop()
+        else:
+            self._timer.start(max(0, int((due - self._clock()) * 1000)))
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """
+    :return shared Scheduler instance. Should be called from the main thread
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
+
+
+def call_later(delay, fn, *args):
+    return get_scheduler().call_later(delay, fn, *args)
+
+
+def call_every(interval, fn, *args, delay=None):
+    return get_scheduler().call_every(interval, fn, *args, delay=delay)
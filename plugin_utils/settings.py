@@ -0,0 +1,80 @@
+import plugin_super_class
+import json
+import os
+from plugin_utils import scheduler
+
+
+class SettingsStore:
+    """
+    In-memory copy of plugin's settings.json. Reads are served from memory, changes are written
+    to disk at most delay seconds after the first unsaved change or on flush()/close().
+    File is replaced atomically, so it's never left half-written.
+    """
+
+    def __init__(self, plugin, delay=2.0):
+        """
+        :param plugin: plugin instance. Its load_settings() is used for initial loading
+        :param delay: max number of seconds between change and write
+        """
+        self._path = plugin_super_class.path_to_data(plugin.get_short_name()) + 'settings.json'
+        self._data = json.loads(plugin.load_settings())
+        self._delay = delay
+        self._job = None
+        self.writes = 0
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self.changed()
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self.changed()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def pop(self, key, *default):
+        value = self._data.pop(key, *default)
+        self.changed()
+        return value
+
+    def changed(self):
+        """
+        Marks settings as changed. Should be called after in-place changes of stored values
+        """
+        if self._job is None:
+            self._job = scheduler.call_later(self._delay, self.flush)
+
+    def is_dirty(self):
+        return self._job is not None
+
+    def flush(self):
+        """
+        Writes unsaved changes to disk
+        """
+        if self._job is None:
+            return
+        self._job.cancel()
+        self._job = None
+        tmp = self._path + '.tmp'
+        with open(tmp, 'wb') as fl:
+            fl.write(bytes(json.dumps(self._data), 'utf-8'))
+            fl.flush()
+            os.fsync(fl.fileno())
+        os.replace(tmp, self._path)
+        self.writes += 1
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,113 @@
+import json
+import sys
+import time
+import traceback
+from plugin_utils import scheduler
+
+
+class ShutdownReport:
+    """
+    Durations of plugins' close() calls. A plugin overran the deadline if its close() alone took longer
+    than deadline or finished after deadline counted from the first close() call
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.closes = []  # (name, started, seconds) relative to the first close() call
+        self._start = None
+
+    def add(self, name, start, seconds):
+        if self._start is None:
+            self._start = start
+        self.closes.append((name, start - self._start, seconds))
+
+    def total(self):
+        return max((started + seconds for _, started, seconds in self.closes), default=0.0)
+
+    def overran(self):
+        return [name for name, started, seconds in self.closes
+                if seconds > self.deadline or started + seconds > self.deadline]
+
+    def to_dict(self):
+        return {
+            'deadline_ms': self.deadline * 1000,
+            'total_ms': round(self.total() * 1000, 3),
+            'closes': [{'plugin': name, 'started_ms': round(started * 1000, 3), 'ms': round(seconds * 1000, 3)}
+                       for name, started, seconds in self.closes],
+            'overran': self.overran()
+        }
+
+    def format(self):
+        lines = ['{}: {:.1f} ms'.format(name, seconds * 1000) for name, _, seconds in self.closes]
+        lines.append('Total: {:.1f} ms, deadline {:.0f} ms'.format(self.total() * 1000, self.deadline * 1000))
+        if self.overran():
+            lines.append('Overran deadline: ' + ', '.join(self.overran()))
+        return '\n'.join(lines)
+
+
+def _timed_close(report, name, close):
+    start = time.perf_counter()
+    try:
+        close()
+    except Exception:
+        traceback.print_exc()
+    finally:
+        report.add(name, start, time.perf_counter() - start)
+
+
+def close_plugins(plugins, deadline=0.1):
+    """
+    Closes plugins one by one and cancels all scheduled jobs. Plugins are closed even after deadline,
+    so they can save data, but they are reported
+    :param plugins: dict name -> plugin instance
+    :param deadline: seconds
+    :return ShutdownReport
+    """
+    report = ShutdownReport(deadline)
+    for name, plugin in plugins.items():
+        _timed_close(report, name, plugin.close)
+    scheduler.get_scheduler().cancel_all()
+    if report.overran():
+        sys.stderr.write('Plugins overran shutdown deadline: {}\n'.format(', '.join(report.overran())))
+    return report
+
+
+def watch(plugins, deadline=0.1, callback=None):
+    """
+    Measures close() calls made by the client. Wrappers are set as instance attributes of plugins
+    :param plugins: dict name -> plugin instance
+    :param callback: called with report once, after the last of plugins was closed. Order of closing is not
+    known in advance
+    :return ShutdownReport filled as plugins are closed
+    """
+    report = ShutdownReport(deadline)
+    pending = set(plugins)
+
+    def wrap(name, close):
+        def wrapper():
+            _timed_close(report, name, close)
+            if name in pending:
+                pending.remove(name)
+                if not pending and callback is not None:
+                    callback(report)
+        return wrapper
+
+    for name, plugin in plugins.items():
+        plugin.close = wrap(name, plugin.close)
+    return report
+
+
+def save_report(report, path):
+    with open(path, 'w') as fl:
+        json.dump(report.to_dict(), fl, indent=2)
+
+
+def load_report(path):
+    """
+    :return dict saved by save_report or None
+    """
+    try:
+        with open(path) as fl:
+            return json.load(fl)
+    except (OSError, ValueError):
+        return None
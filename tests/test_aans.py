@@ -0,0 +1,57 @@
+"""Tests of the AutoAnswer plugin's rules and commands.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+
+class RuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.harness = harness.Harness(2)
+        self.plugin = self.harness.load('AutoAnswer', 'aans', 'AutoAnswer', settings={'friends': {}})
+        self.rule = sys.modules['aans'].Rule
+
+    def test_valid(self):
+        self.assertEqual(self.rule.parse_window('08:30-17:00'), (510, 1020))
+        self.assertEqual(self.rule.parse_window('9:05-0:00'), (545, 0))
+
+    def test_over_midnight(self):
+        rule = self.rule(hours=['22:00-06:00'])
+        self.assertTrue(rule.allows(23 * 60))
+        self.assertTrue(rule.allows(5 * 60))
+        self.assertFalse(rule.allows(12 * 60))
+
+    def test_malformed(self):
+        for window in ('10-12', '10:00', '10:00-', '1000-1200', 'a:bc-d:ef', '10:00-12:00-14:00', '10:0-12:00', ''):
+            self.assertRaises(ValueError, self.rule.parse_window, window)
+
+    def test_out_of_range(self):
+        for window in ('25:99-07:00', '24:00-07:00', '07:00-07:60'):
+            self.assertRaises(ValueError, self.rule.parse_window, window)
+
+    def test_empty(self):
+        self.assertRaises(ValueError, self.rule.parse_window, '10:00-10:00')
+
+    def test_command_rejects_malformed(self):
+        public_key = self.harness.friends[0].tox_id[:64]
+        self.plugin.command('hours 0 10:00-12:00')
+        self.assertEqual(self.plugin._data['friends'][public_key], {'hours': ['10:00-12:00']})
+        for window in ('10-12', '25:99-07:00', '10:00-10:00', '10:00-12:00,3'):
+            self.plugin.command('hours 0 ' + window)
+            self.assertEqual(self.plugin._data['friends'][public_key], {'hours': ['10:00-12:00']})
+        self.assertEqual(self.plugin._policy[public_key].windows, [(600, 720)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tests of the framed lossless packet protocol.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+from plugin_utils import framing, outbox, scheduler
+
+
+class FakePlugin(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def get_short_name(self):
+        return 'test'
+
+    def send_lossless(self, data, friend_number):
+        self.sent.append((data, friend_number))
+
+
+class ProtocolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.protocol = framing.Protocol(FakePlugin(), chunk_size=10, max_pending=2, max_chunks=8, timeout=60.0,
+                                         clock=lambda: self.now)
+        self.payload = 'abcdefghijklmnopqrstuvwxyz0123456789'  # 4 chunks
+
+    def frames(self, payload=None, request_id=1, msg_type='sync'):
+        return framing.make_frames(msg_type, self.payload if payload is None else payload, request_id, 10)
+
+    def receive_all(self, frames, friend_number=0):
+        messages = [self.protocol.receive(frame, friend_number) for frame in frames]
+        return [message for message in messages if message is not None]
+
+    def test_single_frame(self):
+        message = self.protocol.receive(framing.make_frames('digest', 'abc', 5, 10)[0], 3)
+        self.assertEqual((message.type, message.payload, message.request_id, message.friend_number),
+                         ('digest', 'abc', 5, 3))
+        self.assertEqual(message.version, framing.VERSION)
+        self.assertFalse(message.legacy)
+
+    def test_legacy(self):
+        message = self.protocol.receive('new', 1)
+        self.assertTrue(message.legacy)
+        self.assertEqual(message.payload, 'new')
+
+    def test_multi_chunk(self):
+        frames = self.frames()
+        self.assertEqual(len(frames), 4)
+        messages = self.receive_all(frames)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].payload, self.payload)
+        self.assertEqual(self.protocol.pending_count(), 0)
+
+    def test_non_ascii(self):
+        payload = 'шахматы ♞'  # base64 of utf-8, 3 chunks
+        messages = self.receive_all(self.frames(payload))
+        self.assertEqual(messages[0].payload, payload)
+
+    def test_out_of_order(self):
+        frames = self.frames()
+        messages = self.receive_all([frames[2], frames[0], frames[3], frames[1]])
+        self.assertEqual([message.payload for message in messages], [self.payload])
+
+    def test_interleaved_messages(self):
+        first, second = self.frames(request_id=1), self.frames('x' * 25, request_id=2)
+        messages = self.receive_all([first[0], second[0], first[1], second[1], second[2], first[2], first[3]])
+        self.assertEqual([message.payload for message in messages], ['x' * 25, self.payload])
+
+    def test_duplicate_chunk(self):
+        frames = self.frames()
+        messages = self.receive_all([frames[0], frames[1], frames[1], frames[2], frames[3]])
+        self.assertEqual([message.payload for message in messages], [self.payload])
+
+    def test_missing_chunk_times_out(self):
+        frames = self.frames()
+        self.assertEqual(self.receive_all(frames[:3]), [])
+        self.assertEqual(self.protocol.pending_count(), 1)
+        self.now = 61.0
+        # buffers are checked when the next chunked frame arrives
+        self.assertEqual(self.receive_all(self.frames(request_id=2)[:1]), [])
+        self.assertEqual(self.protocol.pending_count(), 1)
+        self.assertEqual(self.protocol.dropped, 1)
+        self.assertEqual(self.receive_all(frames[3:]), [])
+
+    def test_pending_is_bounded(self):
+        for request_id in range(1, 4):
+            self.receive_all(self.frames(request_id=request_id)[:1])
+        self.assertEqual(self.protocol.pending_count(), 2)
+        self.assertEqual(self.protocol.dropped, 1)
+
+    def test_too_many_chunks(self):
+        frames = self.frames('x' * 100)
+        self.assertEqual(self.receive_all(frames), [])
+        self.assertEqual(self.protocol.dropped, len(frames))
+        self.assertEqual(self.protocol.pending_count(), 0)
+
+    def test_truncated_frames(self):
+        frame = self.frames()[0]
+        for data in (frame[:5], frame[:frame.index(':')], framing.MARKER, framing.MARKER + '1:sync:x:0:1:a:'):
+            self.assertIsNone(self.protocol.receive(data, 0))
+        self.assertEqual(self.protocol.dropped, 4)
+
+    def test_invalid_chunk_index(self):
+        self.assertIsNone(self.protocol.receive(framing.MARKER + '1:sync:1:4:4:a:abc', 0))
+        self.assertEqual(self.protocol.pending_count(), 0)
+
+    def test_changed_chunks_count(self):
+        frames = self.frames()
+        self.receive_all(frames[:1])
+        other = framing.make_frames('sync', 'y' * 25, 1, 10)
+        self.assertEqual(self.receive_all(other[1:2]), [])
+        self.assertEqual(self.protocol.pending_count(), 0)
+
+    def test_send_through_outbox(self):
+        old_scheduler = scheduler._scheduler
+        scheduler._scheduler = scheduler.Scheduler(clock=lambda: 0.0, use_timer=False)
+        try:
+            box = outbox.get_outbox()
+            self.protocol.send('sync', self.payload, 7, 3)
+            while len(box):
+                box.flush()
+        finally:
+            scheduler._scheduler = old_scheduler
+        sent = self.protocol._plugin.sent
+        self.assertEqual(len(sent), 4)
+        messages = self.receive_all([data for data, _ in sent], 7)
+        self.assertEqual([(message.payload, message.request_id) for message in messages], [(self.payload, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
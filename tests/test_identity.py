@@ -0,0 +1,88 @@
+"""Tests of the friend identity index shared by plugins.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import collections
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+from plugin_utils import identity
+
+
+class CountingTox(harness.FakeTox):
+    """FakeTox counting calls of lookup methods."""
+
+    def __init__(self, address, friends):
+        super(CountingTox, self).__init__(address, friends)
+        self.calls = collections.Counter()
+
+    def friend_get_public_key(self, friend_number):
+        self.calls['friend_get_public_key'] += 1
+        return super(CountingTox, self).friend_get_public_key(friend_number)
+
+    def friend_by_public_key(self, public_key):
+        self.calls['friend_by_public_key'] += 1
+        return super(CountingTox, self).friend_by_public_key(public_key)
+
+
+class FriendIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        h = harness.Harness(5)
+        self.friends = h.friends
+        self.tox = CountingTox(h.tox.self_get_address(), h.friends)
+        self.index = identity.FriendIndex(self.tox, h.profile)
+
+    def test_lookups(self):
+        friend = self.friends[2]
+        self.assertEqual(self.index.public_key(2), friend.tox_id[:64])
+        self.assertEqual(self.index.tox_id(2), friend.tox_id)
+        self.assertEqual(self.index.number(friend.tox_id), 2)
+        self.assertIsNone(self.index.public_key(10))
+        self.assertIsNone(self.index.number('0' * 64))
+
+    def test_hit_makes_no_tox_call(self):
+        key = self.index.public_key(1)
+        self.index.number(self.friends[3].tox_id)
+        self.tox.calls.clear()
+        for _ in range(3):
+            self.assertEqual(self.index.public_key(1), key)
+            self.assertEqual(self.index.number(key), 1)
+            self.assertEqual(self.index.number(self.friends[3].tox_id), 3)
+        self.assertEqual(self.tox.calls, {})
+
+    def test_delete_invalidates(self):
+        old_key = self.index.public_key(1)
+        self.tox.friend_delete(1)
+        self.assertIsNone(self.index.number(old_key))
+        self.assertIsNone(self.index.public_key(1))
+
+    def test_reused_number(self):
+        old_key = self.index.public_key(1)
+        self.tox.friend_delete(1)
+        new_key = 'AB' * 32
+        self.assertEqual(self.tox.friend_add_norequest(new_key), 1)
+        self.assertEqual(self.index.public_key(1), new_key)
+        self.assertEqual(self.index.number(new_key), 1)
+        self.assertIsNone(self.index.number(old_key))
+
+    def test_re_added_key(self):
+        key = self.index.public_key(4)
+        self.tox.friend_delete(4)
+        self.tox.friend_delete(0)
+        self.assertIsNone(self.index.number(key))
+        self.assertEqual(self.tox.friend_add(key + '0' * 12, 'hi'), 0)
+        self.assertEqual(self.index.number(key), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Tests of the shared queue of outgoing lossless packets.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+from plugin_utils import outbox, scheduler
+
+
+class FakePlugin(object):
+
+    def __init__(self, short_name):
+        self.short_name = short_name
+        self.sent = []
+
+    def get_short_name(self):
+        return self.short_name
+
+    def send_lossless(self, data, friend_number):
+        self.sent.append((data, friend_number))
+
+
+class OutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.old_scheduler = scheduler._scheduler
+        scheduler._scheduler = scheduler.Scheduler(clock=lambda: 0.0, use_timer=False)
+        self.outbox = outbox.Outbox(budget=1)
+        self.plugin = FakePlugin('toxid')
+        self.other = FakePlugin('bday')
+
+    def tearDown(self):
+        scheduler._scheduler = self.old_scheduler
+
+    def test_priorities_and_budget(self):
+        self.outbox.send(self.other, 'low', 1, outbox.LOW)
+        self.outbox.send(self.plugin, 'high', 1, outbox.HIGH)
+        self.outbox.flush()
+        self.assertEqual(self.plugin.sent, [('high', 1)])
+        self.assertEqual(self.other.sent, [])
+        self.outbox.flush()
+        self.assertEqual(self.other.sent, [('low', 1)])
+
+    def test_coalesced_in_same_priority(self):
+        self.outbox.send(self.plugin, 'a', 1, outbox.LOW, 'request')
+        self.outbox.send(self.plugin, 'b', 1, outbox.LOW, 'request')
+        self.assertEqual(len(self.outbox), 1)
+        self.assertEqual(self.outbox.coalesced, 1)
+
+    def test_coalesced_across_priorities(self):
+        # CopyableToxId asks LOW on connection and HIGH on user's copy, the friend answers once
+        self.outbox.send(self.plugin, '', 1, outbox.LOW, 'request')
+        self.outbox.send(self.plugin, '', 1, outbox.HIGH, 'request')
+        self.assertEqual(len(self.outbox), 1)
+        self.outbox.send(self.plugin, '', 1, outbox.LOW, 'request')
+        self.assertEqual(len(self.outbox), 1)
+        self.outbox.send(self.other, 'other', 1, outbox.NORMAL)
+        self.outbox.flush()
+        # kept HIGH priority, so it goes before the NORMAL packet
+        self.assertEqual(self.plugin.sent, [('', 1)])
+        self.assertEqual(self.other.sent, [])
+        self.outbox.flush()
+        self.assertEqual(self.plugin.sent, [('', 1)])
+        self.assertEqual(self.other.sent, [('other', 1)])
+        self.assertEqual(len(self.outbox), 0)
+
+    def test_keys_are_per_friend_and_plugin(self):
+        self.outbox.send(self.plugin, '', 1, outbox.LOW, 'request')
+        self.outbox.send(self.plugin, '', 2, outbox.HIGH, 'request')
+        self.outbox.send(self.other, '', 1, outbox.HIGH, 'request')
+        self.assertEqual(len(self.outbox), 3)
+
+    def test_cancel(self):
+        self.outbox.send(self.plugin, 'move', 1, outbox.HIGH, 'move')
+        self.outbox.cancel(self.plugin, 1, 'move')
+        self.outbox.flush()
+        self.assertEqual(self.plugin.sent, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
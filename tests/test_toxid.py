@@ -0,0 +1,42 @@
+"""Tests of the CopyableToxId plugin's Tox ID store.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+
+class ToxIdStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.harness = harness.Harness(3, seed=47)
+        self.plugin = self.harness.load('CopyableToxId', 'toxid', 'CopyableToxId',
+                                        settings={'send_id': False, 'ids': {}})
+
+    def tearDown(self):
+        self.plugin.close()
+
+    def test_own_tox_id_is_stored(self):
+        address = self.harness.tox.friend_address(1)
+        self.plugin.lossless_packet(address, 1)
+        self.assertEqual(self.plugin.get_tox_id(address[:64]), address)
+
+    def test_tox_id_of_other_friend_is_rejected(self):
+        victim = self.harness.tox.friend_address(2)
+        self.plugin.lossless_packet(victim, 2)
+        forged = victim[:64] + 'DEADBEEF' + '0000'
+        self.plugin.lossless_packet(forged, 1)
+        self.assertEqual(self.plugin.get_tox_id(victim[:64]), victim)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""Tests of the Chess plugin's UCI engine bridge, using the scripted
+stand-in engine from uci_stand_in.py.
+
+    python3 -m unittest discover tests
+
+PyQt5 is required, like for the benchmarks.
+"""
+
+import os
+import sys
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+import harness  # registers fake plugin_super_class
+
+sys.path.insert(0, os.path.join(harness.ROOT, 'Chess'))
+
+import chess
+
+STAND_IN = '{} {}'.format(sys.executable, os.path.join(HERE, 'uci_stand_in.py'))
+
+
+def wait_for(condition, timeout=5.0):
+    """Processes Qt events until condition() is true.
+
+    :return: The last value of condition().
+    """
+    application = harness.application()
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        application.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+class ParseUciInfoTestCase(unittest.TestCase):
+
+    def test_fields(self):
+        info = chess.parse_uci_info('info depth 12 seldepth 18 multipv 1 score cp 35 nodes 1000 nps 5000 time 200 '
+                                    'pv e2e4 e7e5 g1f3')
+        self.assertEqual(info['depth'], 12)
+        self.assertEqual(info['seldepth'], 18)
+        self.assertEqual(info['multipv'], 1)
+        self.assertEqual(info['nodes'], 1000)
+        self.assertEqual(info['nps'], 5000)
+        self.assertEqual(info['time'], 200)
+        self.assertEqual(info['score'], ('cp', 35))
+        self.assertEqual([move.uci for move in info['pv']], ['e2e4', 'e7e5', 'g1f3'])
+
+    def test_mate_score(self):
+        self.assertEqual(chess.parse_uci_info('info depth 5 score mate -3')['score'], ('mate', -3))
+
+    def test_missing_fields(self):
+        info = chess.parse_uci_info('info nodes 10')
+        self.assertEqual(info, {'nodes': 10})
+        self.assertEqual(chess.parse_uci_info('info'), {})
+
+    def test_invalid_values(self):
+        info = chess.parse_uci_info('info depth x score cp y nodes 7')
+        self.assertNotIn('depth', info)
+        self.assertNotIn('score', info)
+        self.assertEqual(info['nodes'], 7)
+
+    def test_pv_ends_at_invalid_move(self):
+        info = chess.parse_uci_info('info pv e2e4 lowerbound depth 3')
+        self.assertEqual([move.uci for move in info['pv']], ['e2e4'])
+        self.assertEqual(info['depth'], 3)
+
+    def test_string_is_ignored(self):
+        self.assertEqual(chess.parse_uci_info('info depth 2 string depth 9 pv e2e4'), {'depth': 2})
+
+
+class UciEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engines = []
+        self.infos, self.moves, self.errors = [], [], []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.quit()
+
+    def engine(self, command=STAND_IN, timeout=10):
+        engine = chess.UciEngine(command, timeout)
+        engine.info.connect(self.infos.append)
+        engine.bestmove.connect(self.moves.append)
+        engine.error.connect(self.errors.append)
+        self.engines.append(engine)
+        return engine
+
+    def test_analyse(self):
+        engine = self.engine()
+        engine.analyse(chess.START_FEN, 2)
+        self.assertTrue(wait_for(lambda: self.moves and self.infos and self.infos[-1]['depth'] == 2))
+        self.assertEqual(self.moves, ['e2e4'])
+        # info lines are coalesced, earlier depths may be skipped but never reordered
+        depths = [info['depth'] for info in self.infos]
+        self.assertEqual(depths, sorted(set(depths)))
+        self.assertEqual(self.infos[-1]['score'], ('cp', 20))
+        self.assertEqual([move.uci for move in self.infos[-1]['pv']], ['e2e4', 'e7e5'])
+        self.assertEqual(self.errors, [])
+
+    def test_process_is_reused(self):
+        engine = self.engine()
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: len(self.moves) == 1))
+        process = engine._process
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: len(self.moves) == 2))
+        self.assertIs(engine._process, process)
+
+    def test_stop_discards_search(self):
+        engine = self.engine()
+        engine.analyse(chess.START_FEN)
+        self.assertTrue(wait_for(lambda: self.infos and self.infos[-1]['depth'] == 3))
+        engine.stop()
+        # bestmove of a stopped search is stale, nothing is reported
+        self.assertFalse(wait_for(lambda: self.moves, 0.5))
+
+    def test_restart(self):
+        engine = self.engine()
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: self.moves))
+        engine.quit()
+        self.assertTrue(wait_for(lambda: engine._process.returncode is not None))
+        engine = self.engine()
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: len(self.moves) == 2))
+        self.assertEqual(self.errors, [])
+
+    def test_restart_after_crash(self):
+        engine = self.engine(STAND_IN + ' --exit-on-go')
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: self.errors))
+        self.assertEqual(self.moves, [])
+        self.assertIsNone(engine._process)
+        engine = self.engine()
+        engine.analyse(chess.START_FEN, 1)
+        self.assertTrue(wait_for(lambda: self.moves))
+
+    def test_exit_in_search(self):
+        engine = self.engine(STAND_IN + ' --exit-in-search')
+        engine.analyse(chess.START_FEN, 3)
+        self.assertTrue(wait_for(lambda: self.errors))
+        self.assertEqual(self.errors, ['Engine exited unexpectedly.'])
+        self.assertEqual(self.moves, [])
+        self.assertIsNone(engine._process)
+        self.assertFalse(engine._searching)
+        # a later search does nothing, Chess creates a new engine after the error
+        engine.analyse(chess.START_FEN, 1)
+        self.assertFalse(wait_for(lambda: self.moves, 0.2))
+        engine.quit()
+        self.assertTrue(wait_for(lambda: not engine._thread.is_alive()))
+        self.assertEqual(len(self.errors), 1)
+
+    def test_handshake_timeout(self):
+        engine = self.engine(STAND_IN + ' --mute', 0.5)
+        self.assertTrue(wait_for(lambda: engine._process is not None))
+        process = engine._process
+        self.assertTrue(wait_for(lambda: self.errors))
+        self.assertIn('handshake', self.errors[0])
+        self.assertIsNone(engine._process)
+        self.assertTrue(wait_for(lambda: process.returncode is not None))
+
+    def test_quit_during_handshake(self):
+        engine = self.engine(STAND_IN + ' --mute')
+        self.assertTrue(wait_for(lambda: engine._process is not None))
+        process = engine._process
+        start = time.monotonic()
+        engine.quit()
+        self.assertTrue(wait_for(lambda: not engine._thread.is_alive()))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertIsNotNone(process.returncode)
+        self.assertEqual(self.errors, [])
+
+    def test_missing_binary(self):
+        engine = self.engine(os.path.join(HERE, 'no-such-engine'))
+        self.assertTrue(wait_for(lambda: self.errors))
+        engine.analyse(chess.START_FEN, 1)
+        engine.stop()
+        self.assertFalse(wait_for(lambda: self.moves, 0.2))
+        self.assertIsNone(engine._process)
+
+
+if __name__ == '__main__':
+    unittest.main()
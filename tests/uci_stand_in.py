@@ -0,0 +1,56 @@
+"""Scripted UCI engine used by the tests instead of a real engine.
+
+It answers the handshake, prints one `info` line per depth and
+`bestmove e2e4` for every search. `go infinite` prints three lines and
+waits for `stop`.
+
+    python3 uci_stand_in.py [--exit-on-go | --exit-in-search | --mute]
+
+With `--exit-on-go` the engine exits when a search is started, with
+`--exit-in-search` after the first `info` line of a search, like a
+crashing engine. With `--mute` it never answers the handshake.
+"""
+
+import sys
+
+
+def main():
+    exit_on_go = '--exit-on-go' in sys.argv[1:]
+    exit_in_search = '--exit-in-search' in sys.argv[1:]
+    mute = '--mute' in sys.argv[1:]
+    searching = False
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if mute:
+            continue
+        if command == 'uci':
+            print('id name Stand-in')
+            print('uciok', flush=True)
+        elif command == 'isready':
+            print('readyok', flush=True)
+        elif command == 'go':
+            if exit_on_go:
+                return
+            depth = int(tokens[2]) if len(tokens) > 2 and tokens[1] == 'depth' else 3
+            for d in range(1, depth + 1):
+                print('info depth {} seldepth {} score cp {} nodes {} pv e2e4 e7e5'.format(d, d, 10 * d, 100 * d),
+                      flush=True)
+                if exit_in_search:
+                    return
+            if len(tokens) > 1 and tokens[1] == 'infinite':
+                searching = True
+            else:
+                print('bestmove e2e4', flush=True)
+        elif command == 'stop':
+            if searching:
+                searching = False
+                print('bestmove e2e4', flush=True)
+        elif command == 'quit':
+            return
+
+
+if __name__ == '__main__':
+    main()
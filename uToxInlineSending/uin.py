@@ -1,19 +1,21 @@
 import plugin_super_class
+from plugin_utils import lazy
+lazy.importing(__name__)
+from plugin_utils import hooks
 
 
+@lazy.measure_startup
 class uToxInlineSending(plugin_super_class.PluginSuperClass):
 
     def __init__(self, *args):
         super(uToxInlineSending, self).__init__('uToxInlineSending', 'uin', *args)
-        self._tmp = None
 
     def stop(self):
-        self._profile.send_screenshot = self._tmp
+        hooks.remove(self._profile, 'send_screenshot', self._short_name)
 
     def start(self):
-        self._tmp = self._profile.send_screenshot
+        hooks.add(self._profile, 'send_screenshot', self._short_name, self.send_screenshot)
 
-        def func(data):
-            self._profile.send_inline(data, 'utox-inline.png')
-
-        self._profile.send_screenshot = func
+    def send_screenshot(self, data):
+        self._profile.send_inline(data, 'utox-inline.png')
+        return True